@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+
+import khun_poker
+from grid import parse_grid
+from main import CFR
+
+
+# Per-phase timings of one CFR iteration over a grid of (coins, players) configurations, with Kuhn poker as a small
+# baseline. Every phase is timed with timeit: the number of calls per repeat is calibrated so a repeat takes at
+# least ~0.2s, and the best and median time per call over the repeats are reported.
+#
+#   uv run benchmark.py run -o before.json
+#   uv run benchmark.py compare before.json after.json
+
+DEFAULT_GRID = "1x3,1x4,2x3,2x4"
+
+
+def _machine_metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "commit": commit,
+    }
+
+
+def time_phase(func, repeat: int, min_time: float) -> dict:
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    # autorange stops at 0.2s, scale up when a longer measurement window is asked for
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+
+    per_call = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {"best": min(per_call), "median": statistics.median(per_call), "number": number, "repeat": repeat}
+
+
+def bench_coin_game(number_coins: int, number_players: int, repeat: int, min_time: float, warmup: int) -> dict:
+    def init():
+        cfr = CFR(number_coins, number_players)
+        cfr.init_info_sets()
+        return cfr
+
+    # Building the infosets can take seconds on the bigger configurations, it is timed once per repeat
+    init_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cfr = init()
+        init_times.append(time.perf_counter() - start)
+
+    # A few iterations first, so the phases run on a strategy that is no longer uniform
+    for _ in range(warmup):
+        cfr.iteration()
+
+    def utilities_sweep():
+        for historic in reversed(cfr.sorted_infoSets):
+            cfr.update_utilities_of_info_states(historic)
+
+    phases = {
+        "init_info_sets": {
+            "best": min(init_times), "median": statistics.median(init_times), "number": 1, "repeat": repeat,
+        },
+        "update_beliefs": time_phase(cfr.update_beliefs, repeat, min_time),
+        "update_utilities_of_info_states": time_phase(utilities_sweep, repeat, min_time),
+        "update_utilities": time_phase(cfr.update_utilities, repeat, min_time),
+        "calc_infoset_likelihoods": time_phase(cfr.calc_infoset_likelihoods, repeat, min_time),
+        "calc_gains": time_phase(cfr.calc_gains, repeat, min_time),
+        "update_strat": time_phase(cfr.update_strat, repeat, min_time),
+        "iteration": time_phase(cfr.iteration, repeat, min_time),
+    }
+
+    return {
+        "game": "coin_game",
+        "config": {"number_coins": number_coins, "number_players": number_players},
+        "infosets": len(cfr.store),
+        "phases": phases,
+    }
+
+
+def bench_khun_poker(repeat: int, min_time: float, warmup: int) -> dict:
+    def init():
+        # khun_poker keeps its infosets in module globals
+        khun_poker.infoSets.clear()
+        khun_poker.sortedInfoSets.clear()
+        khun_poker.initInfoSets()
+
+    def utilities_sweep():
+        for infoSetStr in reversed(khun_poker.sortedInfoSets):
+            khun_poker.updateUtilitiesForInfoSetStr(infoSetStr)
+
+    def iteration():
+        khun_poker.updateBeliefs()
+        utilities_sweep()
+        khun_poker.calcInfoSetLikelihoods()
+        khun_poker.calcGains()
+        khun_poker.updateStrategies()
+
+    phases = {"init_info_sets": time_phase(init, repeat, min_time)}
+
+    init()
+    for _ in range(warmup):
+        iteration()
+
+    phases.update({
+        "update_beliefs": time_phase(khun_poker.updateBeliefs, repeat, min_time),
+        "update_utilities_of_info_states": time_phase(utilities_sweep, repeat, min_time),
+        "calc_infoset_likelihoods": time_phase(khun_poker.calcInfoSetLikelihoods, repeat, min_time),
+        "calc_gains": time_phase(khun_poker.calcGains, repeat, min_time),
+        "update_strat": time_phase(khun_poker.updateStrategies, repeat, min_time),
+        "iteration": time_phase(iteration, repeat, min_time),
+    })
+
+    return {"game": "khun_poker", "config": {}, "infosets": len(khun_poker.sortedInfoSets), "phases": phases}
+
+
+def run_benchmarks(grid: list[tuple[int, int]], repeat: int = 5, min_time: float = 0.2, warmup: int = 10,
+                   khun: bool = True) -> dict:
+    results = {}
+    for number_coins, number_players in grid:
+        name = f"coin_game_c{number_coins}p{number_players}"
+        print(f"Benchmarking {name}", flush=True)
+        results[name] = bench_coin_game(number_coins, number_players, repeat, min_time, warmup)
+
+    if khun:
+        print("Benchmarking khun_poker", flush=True)
+        results["khun_poker"] = bench_khun_poker(repeat, min_time, warmup)
+
+    return {"metadata": _machine_metadata(), "results": results}
+
+
+def compare_results(base: dict, new: dict, threshold: float):
+    # Yields (benchmark, phase, base time, new time, ratio, status) for every phase present in both files
+    for name, base_result in base["results"].items():
+        new_result = new["results"].get(name)
+        if new_result is None:
+            continue
+        for phase, base_timing in base_result["phases"].items():
+            new_timing = new_result["phases"].get(phase)
+            if new_timing is None:
+                continue
+
+            ratio = new_timing["best"] / base_timing["best"] if base_timing["best"] > 0 else float("inf")
+            if ratio > 1 + threshold:
+                status = "REGRESSION"
+            elif ratio < 1 / (1 + threshold):
+                status = "improvement"
+            else:
+                status = ""
+            yield name, phase, base_timing["best"], new_timing["best"], ratio, status
+
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3f}{unit}"
+    return f"{seconds / 1e-9:.1f}ns"
+
+
+def print_results(results: dict):
+    print(f"{'':<36}{'best':>12}{'median':>12}")
+    for name, result in results["results"].items():
+        print(f"{name} ({result['infosets']} infosets)")
+        for phase, timing in result["phases"].items():
+            print(f"  {phase:<34}{_format_time(timing['best']):>12}{_format_time(timing['median']):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the phases of a CFR iteration")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Time every phase over a grid of configurations")
+    run_parser.add_argument(
+        "--grid", type=str, default=DEFAULT_GRID, help="Comma separated CxP configurations, e.g. 1x3,2x3"
+    )
+    run_parser.add_argument("--repeat", type=int, default=5, help="Timing repeats per phase")
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="Minimum duration of one repeat in seconds")
+    run_parser.add_argument("--warmup", type=int, default=10, help="CFR iterations run before timing the phases")
+    run_parser.add_argument("--no-khun", action="store_true", help="Skip the Kuhn poker baseline")
+    run_parser.add_argument("-o", "--output", type=str, default="benchmark.json", help="Results file")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files and flag regressions")
+    compare_parser.add_argument("base", type=str, help="Reference results")
+    compare_parser.add_argument("new", type=str, help="Results to check")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Relative slowdown of the best time flagged as a regression"
+    )
+
+    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
+
+    if args["command"] == "run":
+        results = run_benchmarks(
+            parse_grid(args["grid"]), repeat=args["repeat"], min_time=args["min_time"], warmup=args["warmup"],
+            khun=not args["no_khun"],
+        )
+        with open(args["output"], "w") as f:
+            json.dump(results, f, indent=2)
+        print_results(results)
+        print(f"Results written to {args['output']}")
+        return
+
+    with open(args["base"], "r") as f:
+        base = json.load(f)
+    with open(args["new"], "r") as f:
+        new = json.load(f)
+
+    for key in ("platform", "processor", "cpu_count", "python", "numpy"):
+        if base["metadata"].get(key) != new["metadata"].get(key):
+            print(f"Warning: {key} differs ({base['metadata'].get(key)} vs {new['metadata'].get(key)})")
+
+    regressions = 0
+    for name, phase, base_time, new_time, ratio, status in compare_results(base, new, args["threshold"]):
+        regressions += status == "REGRESSION"
+        print(f"{name:<20}{phase:<34}{_format_time(base_time):>12}{_format_time(new_time):>12}{ratio:>8.2f}x  {status}")
+
+    print(f"{regressions} regression(s) above {args['threshold']:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from itertools import product
+
+import numpy as np
+
+
+# Exact best response for the coin game. The public tree (the guesses made so far) is enumerated once, level by
+# level, together with every coin vector; a backward pass then gives, for each node, the probability that the
+# coin sum is still guessed by one of the remaining seats, and a forward pass gives the reach probability of the
+# other seats. Both are batched NumPy operations over whole levels.
+#
+# Level k holds the nodes where seat k is about to guess, i.e. sequences of k distinct guesses, and seat k plays
+# from infoset (coins of seat k,) + guesses. Payoffs follow CFR.calc_util_terminal_node: the seat that guesses the
+# sum gets P - 1, every other seat -1, and nobody gets anything when the sum is never guessed.
+
+class BestResponseTree:
+    def __init__(self, cfr):
+        self.number_players = cfr.number_players
+        self.number_coins = cfr.number_coins
+        self.num_actions = cfr.num_actions
+
+        self.coins = np.array(list(product(range(self.number_coins + 1), repeat=self.number_players)), dtype=np.intp)
+        self.coin_sums = self.coins.sum(axis=1)
+        num_coin_vectors = len(self.coins)
+
+        # seqs[k] are the guess sequences of level k; children[k][s, a] is the level k + 1 index of s + (a,)
+        # or n_{k+1} (a padding row) when a was already guessed
+        self.seqs = [np.zeros((1, 0), dtype=np.intp)]
+        self.children = []
+        for k in range(0, self.number_players):
+            seqs = self.seqs[k]
+            legal = np.ones((len(seqs), self.num_actions), dtype=bool)
+            legal[np.arange(len(seqs))[:, None], seqs] = False
+
+            parents, actions = np.nonzero(legal)
+            children = np.full((len(seqs), self.num_actions), len(parents), dtype=np.intp)
+            children[parents, actions] = np.arange(len(parents))
+
+            self.children.append(children)
+            self.seqs.append(np.concatenate((seqs[parents], actions[:, None]), axis=1))
+
+        # rows[k][s, m] is the infoset row seat k plays at node s when the coins are coins[m]
+        self.rows = []
+        for k in range(0, self.number_players):
+            rows_by_coin = np.array([
+                [cfr.store.index[(coin,) + tuple(int(g) for g in seq)] for coin in range(self.number_coins + 1)]
+                for seq in self.seqs[k]
+            ], dtype=np.intp)
+            self.rows.append(rows_by_coin[:, self.coins[:, k]])
+
+        # already_guessed[k][s, m]: the coin sum of coins[m] was guessed by one of the first k seats
+        self.already_guessed = [
+            (self.seqs[k][:, :, None] == self.coin_sums[None, None, :]).any(axis=1) for k in range(self.number_players)
+        ]
+        self.coin_onehot = [
+            np.eye(self.number_coins + 1)[self.coins[:, k]] for k in range(self.number_players)
+        ]
+        self.chance = 1 / num_coin_vectors
+
+    def _level_strategy(self, strategy: np.ndarray, k: int) -> np.ndarray:
+        # (n_k, M, A) strategy of seat k at every node of level k
+        return strategy[self.rows[k]]
+
+    def evaluate(self, strategy: np.ndarray, legal: np.ndarray):
+        # Returns, per seat, the best response value against the others playing `strategy` and the value of
+        # playing `strategy` itself
+        strategy = np.where(legal, strategy, 0.0)
+        num_p = self.number_players
+        is_sum = np.arange(self.num_actions)[None, :] == self.coin_sums[:, None]
+
+        level_strats = [self._level_strategy(strategy, k) for k in range(num_p)]
+
+        # Backward pass: sum_guessed[k][s, m] = P(the sum is guessed by seat k or later | node s, coins m)
+        sum_guessed = [None] * (num_p + 1)
+        sum_guessed[num_p] = np.zeros((len(self.seqs[num_p]), len(self.coins)))
+        for k in reversed(range(0, num_p)):
+            next_guessed = np.vstack((sum_guessed[k + 1], np.zeros((1, len(self.coins)))))
+            continuation = next_guessed[self.children[k]].transpose(0, 2, 1)
+            continuation = np.where(is_sum[None, :, :], 1.0, continuation)
+            sum_guessed[k] = (level_strats[k] * continuation).sum(axis=2)
+
+        # Forward pass: reach[k][s, m] = chance * product of the strategies of seats 0..k-1 along s
+        reach = [np.full((1, len(self.coins)), self.chance)]
+        for k in range(0, num_p - 1):
+            parents, actions = np.nonzero(self.children[k] < len(self.seqs[k + 1]))
+            next_reach = np.zeros((len(self.seqs[k + 1]), len(self.coins)))
+            next_reach[self.children[k][parents, actions]] = reach[k][parents] * level_strats[k][parents, :, actions]
+            reach.append(next_reach)
+
+        br_values = np.zeros(num_p)
+        values = np.zeros(num_p)
+        for k in range(0, num_p):
+            next_guessed = np.vstack((sum_guessed[k + 1], np.zeros((1, len(self.coins)))))
+            lose_later = next_guessed[self.children[k]].transpose(0, 2, 1)
+
+            # util[s, m, a] of seat k guessing a at node s with coins m
+            util = np.where(is_sum[None, :, :], num_p - 1.0, -lose_later)
+            util = np.where(self.already_guessed[k][:, :, None], -1.0, util)
+
+            weighted = reach[k][:, :, None] * util
+            values[k] = (weighted * level_strats[k]).sum()
+
+            # The best responder only knows its own coins: aggregate the coin vectors per infoset
+            infoset_util = np.einsum('sma,mc->sca', weighted, self.coin_onehot[k])
+            legal_here = self.children[k] < len(self.seqs[k + 1])
+            infoset_util = np.where(legal_here[:, None, :], infoset_util, -np.inf)
+            br_values[k] = infoset_util.max(axis=2).sum()
+
+        return br_values, values
+
+    def exploitability(self, strategy: np.ndarray, legal: np.ndarray) -> float:
+        # NashConv: total amount the seats could gain by deviating alone. It is 0 exactly at a Nash equilibrium.
+        br_values, values = self.evaluate(strategy, legal)
+        return float((br_values - values).sum())
+
+
+def exploitability(cfr, tree: BestResponseTree = None) -> float:
+    if tree is None:
+        tree = BestResponseTree(cfr)
+    return tree.exploitability(cfr.store.strategy, cfr.store.legal)
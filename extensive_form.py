@@ -0,0 +1,382 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+# Game-agnostic CFR on a compiled game tree. A game implements the small Game interface below; compile_game()
+# enumerates it once into flat arrays (decision nodes grouped by depth, terminal utilities, a child table), and
+# TreeCFR runs vectorized CFR iterations on those arrays: a forward pass for the reach probabilities, a backward
+# pass for the node values, then the counterfactual regrets summed per infoset with np.add.reduceat.
+#
+# Every solver keeps its state on its own instance (the compiled tree is read-only and can be shared), so any
+# number of solves can run side by side in one process. Games that only differ in their payoffs or starting strategy
+# can also be solved as one batch: the solver arrays then get leading batch axes.
+#
+# Chance only acts at the root (it deals the private information of every player), and the history of actions is
+# public, so all the nodes of an infoset are at the same depth. Both hold for the coin game and Kuhn poker.
+
+# Update rules shared with main.CFR, which imports them (and regret_matching) from here
+CFR_VARIANTS = ("vanilla", "cfr+", "dcfr", "linear")
+# Discounted CFR parameters, the ones recommended by Brown & Sandholm
+DCFR_ALPHA = 1.5
+DCFR_BETA = 0.0
+DCFR_GAMMA = 2.0
+
+
+class Game(ABC):
+    num_players: int
+    # Labels of the actions, action ids are positions in this list
+    actions: list
+
+    @abstractmethod
+    def chance_outcomes(self) -> list:
+        # [(deal, probability)], a deal holds the private information of every player
+        ...
+
+    @abstractmethod
+    def is_terminal(self, history: tuple) -> bool:
+        ...
+
+    @abstractmethod
+    def current_player(self, history: tuple) -> int:
+        ...
+
+    @abstractmethod
+    def legal_actions(self, history: tuple) -> list[int]:
+        ...
+
+    @abstractmethod
+    def infoset_key(self, deal, history: tuple) -> str:
+        # What the player to act knows: its own part of the deal and the public history
+        ...
+
+    @abstractmethod
+    def terminal_utility(self, deal, history: tuple) -> tuple:
+        # One utility per player
+        ...
+
+
+class GameTree:
+    def __init__(self, game: Game, max_nodes: int = 10_000_000):
+        self.num_players = game.num_players
+        self.actions = list(game.actions)
+        self.num_actions = len(self.actions)
+
+        self.infoset_keys = []
+        self.index: dict[str, int] = {}
+        infoset_legal = []
+        infoset_player = []
+        infoset_depth = []
+
+        node_infoset, node_player, node_chance, node_parent, node_action = [], [], [], [], []
+        term_utility, term_parent, term_action = [], [], []
+        level_bounds = [0]
+
+        # Breadth first, so the decision nodes of every depth are a contiguous block of ids
+        level = [(deal, (), prob, -1, -1) for deal, prob in game.chance_outcomes()]
+        depth = 0
+        while level:
+            next_level = []
+            for deal, history, prob, parent, action in level:
+                if game.is_terminal(history):
+                    term_utility.append(game.terminal_utility(deal, history))
+                    term_parent.append(parent)
+                    term_action.append(action)
+                    continue
+
+                key = game.infoset_key(deal, history)
+                infoset = self.index.get(key)
+                player = game.current_player(history)
+                if infoset is None:
+                    infoset = self.index[key] = len(self.infoset_keys)
+                    self.infoset_keys.append(key)
+                    infoset_legal.append(game.legal_actions(history))
+                    infoset_player.append(player)
+                    infoset_depth.append(depth)
+                elif infoset_depth[infoset] != depth:
+                    raise ValueError(f"Infoset {key} spans several depths, the public history must include every action")
+
+                node = len(node_infoset)
+                node_infoset.append(infoset)
+                node_player.append(player)
+                node_chance.append(prob)
+                node_parent.append(parent)
+                node_action.append(action)
+
+                for child_action in infoset_legal[infoset]:
+                    next_level.append((deal, history + (child_action,), prob, node, child_action))
+
+                if node + len(term_utility) > max_nodes:
+                    raise ValueError(f"The game tree has more than {max_nodes} nodes")
+
+            level_bounds.append(len(node_infoset))
+            level = next_level
+            depth += 1
+
+        num_nodes, num_terminals = len(node_infoset), len(term_utility)
+        self.num_nodes = num_nodes
+        self.num_terminals = num_terminals
+        self.num_infosets = len(self.infoset_keys)
+
+        self.node_infoset = np.array(node_infoset, dtype=np.intp)
+        self.node_player = np.array(node_player, dtype=np.intp)
+        self.node_chance = np.array(node_chance, dtype=np.float64)
+        self.node_parent = np.array(node_parent, dtype=np.intp)
+        self.node_action = np.array(node_action, dtype=np.intp)
+        self.level_slices = [
+            slice(start, end) for start, end in zip(level_bounds[:-1], level_bounds[1:]) if end > start
+        ]
+
+        # Values live in one table: decision nodes, then terminals, then a zero row for illegal actions
+        self.terminal_utility = np.array(term_utility, dtype=np.float64).reshape(num_terminals, self.num_players)
+        self.children = np.full((num_nodes, self.num_actions), num_nodes + num_terminals, dtype=np.intp)
+        decision_children = np.flatnonzero(self.node_parent >= 0)
+        self.children[self.node_parent[decision_children], self.node_action[decision_children]] = decision_children
+        self.children[term_parent, term_action] = num_nodes + np.arange(num_terminals)
+
+        self.legal = np.zeros((self.num_infosets, self.num_actions), dtype=bool)
+        for infoset, actions in enumerate(infoset_legal):
+            self.legal[infoset, actions] = True
+        self.num_legal = self.legal.sum(axis=1)
+        self.infoset_player = np.array(infoset_player, dtype=np.intp)
+        self.infoset_depth = np.array(infoset_depth, dtype=np.intp)
+
+        # Nodes sorted by infoset, so per-infoset sums are one np.add.reduceat
+        self.infoset_order = np.argsort(self.node_infoset, kind="stable")
+        self.infoset_starts = np.searchsorted(self.node_infoset[self.infoset_order], np.arange(self.num_infosets))
+
+        self.roots = np.flatnonzero(self.node_parent < 0)
+
+
+def compile_game(game: Game, max_nodes: int = 10_000_000) -> GameTree:
+    return GameTree(game, max_nodes)
+
+
+def stack_terminal_utilities(tree: GameTree, games: list[Game]) -> np.ndarray:
+    # Terminal utilities of games with the same tree as `tree` (e.g. other stakes), stacked on a batch axis for
+    # TreeCFR
+    utilities = []
+    for game in games:
+        other = compile_game(game)
+        if other.infoset_keys != tree.infoset_keys or not np.array_equal(other.children, tree.children):
+            raise ValueError(f"{type(game).__name__} does not have the same game tree")
+        utilities.append(other.terminal_utility)
+    return np.stack(utilities)
+
+
+def regret_matching(cumulativeGain: np.ndarray, legal: np.ndarray, num_legal: np.ndarray) -> np.ndarray:
+    # Positive cumulative gains normalized over the legal actions, uniform when none is positive
+    positive = np.where(legal, np.maximum(cumulativeGain, 0), 0.0)
+    total = positive.sum(axis=-1, keepdims=True)
+    uniform = legal / num_legal[..., None]
+    return np.where(total > 0, positive / np.where(total > 0, total, 1), uniform)
+
+
+class TreeCFR:
+    dcfr_alpha = DCFR_ALPHA
+    dcfr_beta = DCFR_BETA
+    dcfr_gamma = DCFR_GAMMA
+
+    def __init__(self, tree: GameTree, variant: str = "vanilla", terminal_utility: np.ndarray = None,
+                 initial_strategy: np.ndarray = None, average_policy: bool = True):
+        # terminal_utility (batch..., terminals, players) and initial_strategy (batch..., infosets, actions) may carry
+        # leading batch axes: every array of the solver then gets them too, and one iteration advances the whole batch
+        # of games that share the tree (e.g. other stakes, see stack_terminal_utilities) from their own start.
+        if variant not in CFR_VARIANTS:
+            raise ValueError(f"Unknown CFR variant {variant}")
+
+        self.tree = tree
+        self.variant = variant
+        # Whether policy() (the strategy written out and scored) is the average or the current strategy
+        self.average_policy = average_policy
+        if terminal_utility is None:
+            terminal_utility = tree.terminal_utility
+
+        batch_shape = terminal_utility.shape[:-2]
+        if initial_strategy is not None:
+            batch_shape = np.broadcast_shapes(batch_shape, initial_strategy.shape[:-2])
+        self.batch_shape = batch_shape
+
+        self.cumulativeGain = np.zeros(batch_shape + (tree.num_infosets, tree.num_actions))
+        self.strategySum = np.zeros(batch_shape + (tree.num_infosets, tree.num_actions))
+        if initial_strategy is None:
+            self.strategy = regret_matching(self.cumulativeGain, tree.legal, tree.num_legal)
+        else:
+            self.strategy = np.where(tree.legal, np.broadcast_to(initial_strategy, self.cumulativeGain.shape), 0.0)
+        self.iterations = 0
+
+        # reach[..., n, j]: product of the probabilities of player j's actions on the way to node n
+        self.reach = np.ones(batch_shape + (tree.num_nodes, tree.num_players))
+        # values[..., n, j]: expected utility of player j at node n (decision nodes, terminals, zero row)
+        self.values = np.zeros(batch_shape + (tree.num_nodes + tree.num_terminals + 1, tree.num_players))
+        self.values[..., tree.num_nodes:tree.num_nodes + tree.num_terminals, :] = terminal_utility
+
+    def _scalar(self, value: np.ndarray):
+        # Floats for a single game, arrays over the batch otherwise
+        return float(value) if np.ndim(value) == 0 else value
+
+    def forward(self, strategy: np.ndarray):
+        tree = self.tree
+        reach = self.reach
+        for level in tree.level_slices[1:]:
+            parents = tree.node_parent[level]
+            reach[..., level, :] = reach[..., parents, :]
+            acting = tree.node_player[parents]
+            reach[..., np.arange(level.start, level.stop), acting] *= \
+                strategy[..., tree.node_infoset[parents], tree.node_action[level]]
+
+    def backward(self, strategy: np.ndarray):
+        tree = self.tree
+        values = self.values
+        for level in reversed(tree.level_slices):
+            node_strategy = strategy[..., tree.node_infoset[level], :]
+            values[..., level, :] = (node_strategy[..., None] * values[..., tree.children[level], :]).sum(axis=-2)
+
+    def opponent_reach(self, player: np.ndarray = None) -> np.ndarray:
+        # Chance times the reach of every player but `player` (the player to act by default), per decision node
+        tree = self.tree
+        if player is None:
+            player = tree.node_player
+        own = np.arange(tree.num_players)[None, :] == np.asarray(player)[..., None]
+        return tree.node_chance * np.where(own, 1.0, self.reach).prod(axis=-1)
+
+    def infoset_sum(self, per_node: np.ndarray) -> np.ndarray:
+        tree = self.tree
+        return np.add.reduceat(per_node[..., tree.infoset_order, :], tree.infoset_starts, axis=-2)
+
+    def update(self):
+        tree = self.tree
+        t = self.iterations + 1
+        strategy = self.strategy
+
+        # Counterfactual value of every action of every node, seen by the player to act
+        action_values = self.values[..., tree.children, tree.node_player[:, None]]
+        node_strategy = strategy[..., tree.node_infoset, :]
+        node_value = (node_strategy * action_values).sum(axis=-1, keepdims=True)
+        legal = tree.legal[tree.node_infoset]
+        regrets = np.where(legal, action_values - node_value, 0.0) * self.opponent_reach()[..., None]
+        instant = self.infoset_sum(regrets)
+
+        own_reach = self.reach[..., np.arange(tree.num_nodes), tree.node_player]
+        played = self.infoset_sum(own_reach[..., None] * node_strategy)
+
+        if self.variant == "vanilla":
+            self.cumulativeGain += instant
+            self.strategySum += played
+        elif self.variant == "cfr+":
+            self.cumulativeGain = np.maximum(self.cumulativeGain + instant, 0)
+            self.strategySum += t * played
+        elif self.variant == "linear":
+            self.cumulativeGain += t * instant
+            self.strategySum += t * played
+        elif self.variant == "dcfr":
+            cumulative = self.cumulativeGain
+            positive_discount = t ** self.dcfr_alpha / (t ** self.dcfr_alpha + 1)
+            negative_discount = t ** self.dcfr_beta / (t ** self.dcfr_beta + 1)
+            self.cumulativeGain = cumulative * np.where(cumulative > 0, positive_discount, negative_discount) + instant
+            self.strategySum = self.strategySum * (t / (t + 1)) ** self.dcfr_gamma + played
+
+        self.strategy = regret_matching(self.cumulativeGain, tree.legal, tree.num_legal)
+        # Total positive instantaneous regret, the counterpart of the total gain of main.CFR
+        return self._scalar(np.maximum(instant, 0).sum(axis=(-2, -1)))
+
+    def iteration(self):
+        self.forward(self.strategy)
+        self.backward(self.strategy)
+        totGain = self.update()
+        self.iterations += 1
+        return totGain
+
+    def average_strategy(self) -> np.ndarray:
+        return regret_matching(self.strategySum, self.tree.legal, self.tree.num_legal)
+
+    def policy(self) -> np.ndarray:
+        return self.average_strategy() if self.average_policy else self.strategy
+
+    def expected_values(self, strategy: np.ndarray) -> np.ndarray:
+        # Expected utility of every player when everybody plays `strategy`
+        self.forward(strategy)
+        self.backward(strategy)
+        roots = self.tree.roots
+        return (self.tree.node_chance[roots, None] * self.values[..., roots, :]).sum(axis=-2)
+
+    def exploitability(self, strategy: np.ndarray = None):
+        # NashConv of `strategy` (the policy by default): what the players gain by best responding alone
+        tree = self.tree
+        if strategy is None:
+            strategy = self.policy()
+
+        values = self.expected_values(strategy)
+        terminals = slice(tree.num_nodes, tree.num_nodes + tree.num_terminals)
+        br_total = 0.0
+        for player in range(0, tree.num_players):
+            opp_reach = self.opponent_reach(np.full(tree.num_nodes, player))
+            br_values = np.zeros(self.values.shape[:-1])
+            br_values[..., terminals] = self.values[..., terminals, player]
+
+            for level in reversed(tree.level_slices):
+                child_values = br_values[..., tree.children[level]]
+                infosets = tree.node_infoset[level]
+                mine = tree.node_player[level] == player
+
+                # The best responder picks, per infoset, the action with the largest counterfactual value
+                infoset_values = np.zeros(self.batch_shape + (tree.num_infosets, tree.num_actions))
+                np.add.at(infoset_values, (Ellipsis, infosets[mine], slice(None)),
+                          opp_reach[..., level][..., mine, None] * child_values[..., mine, :])
+                best = np.where(tree.legal, infoset_values, -np.inf).argmax(axis=-1)
+
+                level_values = (strategy[..., infosets, :] * child_values).sum(axis=-1)
+                level_values[..., mine] = np.take_along_axis(
+                    child_values[..., mine, :], best[..., infosets[mine]][..., None], axis=-1
+                )[..., 0]
+                br_values[..., level] = level_values
+
+            br_total = br_total + (tree.node_chance[tree.roots] * br_values[..., tree.roots]).sum(axis=-1)
+
+        return self._scalar(br_total - values.sum(axis=-1))
+
+    def strategy_table(self, strategy: np.ndarray = None) -> dict:
+        # {infoset key: {action label: probability}} over the legal actions, the format of the strategy files
+        tree = self.tree
+        if strategy is None:
+            strategy = self.policy()
+        return {
+            key: {str(tree.actions[a]): float(strategy[i, a]) for a in np.flatnonzero(tree.legal[i])}
+            for i, key in enumerate(tree.infoset_keys)
+        }
+
+    def load_initial_strategy(self, strategy) -> int:
+        # Warm start from a {infoset key: {action label: probability}} table, as main.CFR.load_initial_strategy:
+        # the cumulative gains are seeded with the strategy, missing infosets keep the uniform start
+        tree = self.tree
+        labels = {str(label): a for a, label in enumerate(tree.actions)}
+        seeded = 0
+        for i, key in enumerate(tree.infoset_keys):
+            if key not in strategy:
+                continue
+
+            probs = np.zeros(tree.num_actions)
+            for label, prob in strategy[key].items():
+                probs[labels[label]] = prob
+            probs = np.where(tree.legal[i], probs, 0.0)
+            if probs.sum() <= 0:
+                continue
+
+            self.cumulativeGain[..., i, :] = probs / probs.sum()
+            seeded += 1
+
+        self.strategy = regret_matching(self.cumulativeGain, tree.legal, tree.num_legal)
+        return seeded
+
+    def checkpoint_state(self) -> dict:
+        return {
+            'cumulativeGain': self.cumulativeGain,
+            'strategySum': self.strategySum,
+            'iterations': np.array([self.iterations], dtype=np.int64),
+        }
+
+    def load_checkpoint_state(self, checkpoint):
+        self.cumulativeGain = np.array(checkpoint['cumulativeGain'], dtype=np.float64)
+        self.strategySum = np.array(checkpoint['strategySum'], dtype=np.float64)
+        self.iterations = int(checkpoint['iterations'][0])
+        self.strategy = regret_matching(self.cumulativeGain, self.tree.legal, self.tree.num_legal)
@@ -0,0 +1,86 @@
+from itertools import permutations, product
+
+from extensive_form import Game
+from historic_codec import encode_historic
+
+
+# Game definitions for the compiled engine in extensive_form.py. Infoset keys are the ones of the strategy files
+# written by main.py and khun_poker.py, so the play scripts read the strategies of both solvers.
+
+class CoinGame(Game):
+    # Every seat holds 0..C coins; seats then guess the total in turn, without repeating a guess. The seat that
+    # guesses it gets P - 1, every other seat -1, and nobody gets anything when the total is never guessed
+    # (the payoffs of CFR.calc_util_terminal_node).
+    def __init__(self, number_coins: int, number_players: int):
+        self.number_coins = number_coins
+        self.number_players = number_players
+        self.num_players = number_players
+        self.actions = list(range(0, number_players * number_coins + 1))
+
+    def chance_outcomes(self):
+        deals = list(product(range(self.number_coins + 1), repeat=self.number_players))
+        return [(deal, 1 / len(deals)) for deal in deals]
+
+    def is_terminal(self, history):
+        return len(history) == self.number_players
+
+    def current_player(self, history):
+        return len(history)
+
+    def legal_actions(self, history):
+        return [action for action in self.actions if action not in history]
+
+    def infoset_key(self, deal, history):
+        return encode_historic((deal[len(history)],) + tuple(history), len(self.actions))
+
+    def terminal_utility(self, deal, history):
+        coin_sum = sum(deal)
+        for seat, guess in enumerate(history):
+            if guess == coin_sum:
+                return tuple(self.number_players - 1 if i == seat else -1 for i in range(self.number_players))
+        return (0,) * self.number_players
+
+
+class KuhnPoker(Game):
+    # Three cards, each player antes and gets one card; "b" bets (or calls) `bet` more, "p" passes (or folds).
+    # A fold loses the ante, a showdown after two passes is worth the ante and after a call ante + bet.
+    RANKS = ["K", "Q", "J"]
+    TERMINAL_HISTORIES = {"pp", "bb", "bp", "pbb", "pbp"}
+
+    def __init__(self, ante: float = 1, bet: float = 1):
+        self.ante = ante
+        self.bet = bet
+        self.num_players = 2
+        self.actions = ["b", "p"]
+
+    def _history_str(self, history):
+        return "".join(self.actions[action] for action in history)
+
+    def chance_outcomes(self):
+        deals = list(permutations(self.RANKS, 2))
+        return [(deal, 1 / len(deals)) for deal in deals]
+
+    def is_terminal(self, history):
+        return self._history_str(history) in self.TERMINAL_HISTORIES
+
+    def current_player(self, history):
+        return len(history) % 2
+
+    def legal_actions(self, history):
+        return [0, 1]
+
+    def infoset_key(self, deal, history):
+        return deal[len(history) % 2] + self._history_str(history)
+
+    def terminal_utility(self, deal, history):
+        history_str = self._history_str(history)
+        # Lower index in RANKS is the higher card
+        first_wins = self.RANKS.index(deal[0]) < self.RANKS.index(deal[1])
+
+        if history_str == "bp":
+            return self.ante, -self.ante
+        if history_str == "pbp":
+            return -self.ante, self.ante
+
+        stake = self.ante if history_str == "pp" else self.ante + self.bet
+        return (stake, -stake) if first_wins else (-stake, stake)
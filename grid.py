@@ -0,0 +1,10 @@
+# Grids of (coins, players) coin game configurations, shared by benchmark.py and sweep.py
+
+
+def parse_grid(grid: str) -> list[tuple[int, int]]:
+    # "1x3,2x3" -> [(1, 3), (2, 3)]
+    configs = []
+    for item in grid.split(","):
+        coins, players = item.lower().split("x")
+        configs.append((int(coins), int(players)))
+    return configs
@@ -0,0 +1,40 @@
+# Inside the solver an infoset historic is a tuple of small ints: the number of coins chosen by the current
+# player followed by the guesses of the players that already played, e.g. (1, 0, 2).
+#
+# Strategy files keep the original digit-string keys ("102") while every possible sum fits in a single digit,
+# and switch to dot separated keys ("1.10.2") for games where a sum can reach 10 (P * C >= 10).
+
+KEY_SEPARATOR = "."
+
+
+def uses_separator(num_actions: int) -> bool:
+    return num_actions > 10
+
+
+def encode_historic(historic: tuple, num_actions: int) -> str:
+    if uses_separator(num_actions):
+        return KEY_SEPARATOR.join(str(i) for i in historic)
+    return "".join(str(i) for i in historic)
+
+
+def decode_historic(key: str, num_actions: int) -> tuple:
+    if uses_separator(num_actions):
+        return tuple(int(i) for i in key.split(KEY_SEPARATOR))
+    return tuple(int(i) for i in key)
+
+
+# Packed integer codes: a leading 1 followed by the historic digits in base num_actions (which is at least the
+# number of coin values, so coins fit as well). The leading 1 keeps historics of different lengths apart, which
+# lets whole batches of infosets be looked up with a single np.searchsorted over sorted codes.
+
+def pack_historic(historic: tuple, num_actions: int) -> int:
+    code = 1
+    for i in historic:
+        code = code * num_actions + i
+    return code
+
+
+def pack_historic_codes(coins, guess_codes, depth: int, num_actions: int):
+    # Vectorized pack_historic((coin,) + guesses) for a batch of guess sequences of the same length, where
+    # guess_codes holds each sequence already packed in base num_actions (without the leading 1)
+    return (num_actions + coins) * num_actions ** depth + guess_codes
@@ -3,10 +3,17 @@
 # I do not really like this implementation. He tried to replace tree structures with dictionaries, and it confuses me more than it helps.
 
 from __future__ import annotations
+import argparse
 import sys
 from tabulate import tabulate
-import matplotlib.pyplot as plt
 import json
+from itertools import product
+
+import numpy as np
+
+from extensive_form import CFR_VARIANTS, TreeCFR, compile_game, stack_terminal_utilities
+from games import KuhnPoker
+from metrics_log import MetricsLog, plot_metrics
 
 
 infoSets: dict[str, InfoSetData] = {}
@@ -334,17 +341,9 @@ def save_strategy():
         json.dump({infoSetStr: {action: infoSet.actions[action].strategy for action in ACTIONS} for infoSetStr, infoSet in infoSets.items()}, f)
 
 
-if __name__ == "__main__":
+def train_legacy(numIterations: int, gainGrpSize: int, metrics: MetricsLog):
     initInfoSets()
 
-    numIterations = 1_000_000
-    totGains = []
-
-    numGainsToPlot = 500_000
-    gainGrpSize = numIterations // numGainsToPlot
-    if gainGrpSize == 0:
-        gainGrpSize = 1
-
     for i in range(numIterations):
 
         updateBeliefs()
@@ -356,8 +355,8 @@ if __name__ == "__main__":
 
         totGain = calcGains()
 
+        metrics.log(i + 1, "tot_gain", totGain)
         if i % gainGrpSize == 0:
-            totGains.append(totGain)
             print(f"TOT GAIN={totGain:.3f}")
 
         updateStrategies()
@@ -365,20 +364,132 @@ if __name__ == "__main__":
     save_strategy()
     InfoSetData.printInfoSetDataTable(infoSets)
 
-    # The if statement is just meant to make the script easier to run if you don't want to install matplotlib
-    if 'matplotlib' in sys.modules:
-        print(f'Plotting {len(totGains)} totGains')
-        # Generate random x, y coordinates
-        x = [x*gainGrpSize for x in range(len(totGains))]
-        y = totGains
 
-        # Create scatter plot
-        plt.scatter(x, y)
+def train_tree(numIterations: int, gainGrpSize: int, metrics: MetricsLog, variant: str):
+    # Same game on the compiled engine shared with the coin game (extensive_form.py)
+    cfr = TreeCFR(compile_game(KuhnPoker()), variant=variant)
+
+    for i in range(numIterations):
+        totGain = cfr.iteration()
+
+        metrics.log(i + 1, "tot_gain", totGain)
+        if i % gainGrpSize == 0:
+            print(f"TOT GAIN={totGain:.3f}")
+
+    print(f"EXPLOITABILITY={cfr.exploitability():.5f} GAME VALUE={cfr.expected_values(cfr.policy())[0]:.5f}")
+
+    strategy = cfr.strategy_table()
+    with open('strategy.json', 'w') as f:
+        json.dump(strategy, f)
+
+    print(tabulate([[key, *(f"{prob:.2f}" for prob in probs.values())] for key, probs in sorted(strategy.items())],
+                   headers=["InfoSet", "Bet", "Pass"]))
+
+
+def initial_strategy(tree, name: str) -> np.ndarray:
+    # Starting strategy of the tree engine, "uniform" or the one of setInitialStrategiesToSpecificValues
+    if name == "uniform":
+        return tree.legal / tree.num_legal[:, None]
 
-        # Set title and labels
-        plt.title('Total Gain per iteration')
-        plt.xlabel(f'Iteration # ')
-        plt.ylabel('Total Gain In Round')
+    if not infoSets:
+        initInfoSets()
+    setInitialStrategiesToSpecificValues()
+    return np.array([
+        [infoSets[key].actions[action].strategy for action in tree.actions] for key in tree.infoset_keys
+    ])
+
+
+def train_batched(numIterations: int, gainGrpSize: int, metrics: MetricsLog, variant: str,
+                  antes: list[float], bets: list[float], initStrategies: list[str], output: str):
+    # Every (ante, bet, initial strategy) combination is one row of the batch axis of the solver arrays, so a single
+    # vectorized loop solves all of them
+    configs = list(product(antes, bets, initStrategies))
+    tree = compile_game(KuhnPoker())
+    terminal_utility = stack_terminal_utilities(tree, [KuhnPoker(ante, bet) for ante, bet, _ in configs])
+    initial = np.stack([initial_strategy(tree, name) for _, _, name in configs])
+    cfr = TreeCFR(tree, variant=variant, terminal_utility=terminal_utility, initial_strategy=initial)
+
+    for i in range(numIterations):
+        totGain = cfr.iteration()
+
+        # The slowest variant decides when the batch has converged
+        metrics.log(i + 1, "tot_gain", totGain.max())
+        if i % gainGrpSize == 0:
+            print(f"TOT GAIN={totGain.max():.3f}")
+
+    policy = cfr.policy()
+    exploitability = cfr.exploitability(policy)
+    game_values = cfr.expected_values(policy)[:, 0]
+
+    results = []
+    rows = []
+    for v, (ante, bet, initName) in enumerate(configs):
+        results.append({
+            "ante": ante, "bet": bet, "init": initName, "exploitability": float(exploitability[v]),
+            "game_value": float(game_values[v]), "strategy": cfr.strategy_table(policy[v]),
+        })
+        rows.append([ante, bet, initName, f"{exploitability[v]:.5f}", f"{game_values[v]:.5f}"])
+
+    with open(output, 'w') as f:
+        json.dump(results, f)
+
+    print(tabulate(rows, headers=["Ante", "Bet", "Init", "Exploitability", "Game value"]))
+    print(f"{len(configs)} strategies written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--iterations", type=int, default=1_000_000, help="Number of iterations"
+    )
+    parser.add_argument(
+        "--engine", choices=["tree", "legacy"], default="tree",
+        help="Compiled game tree engine or the original dictionary implementation"
+    )
+    parser.add_argument(
+        "--variant", choices=CFR_VARIANTS, default="vanilla", help="CFR variant of the tree engine"
+    )
+    parser.add_argument(
+        "--batched", action="store_true",
+        help="Solve every combination of --antes, --bets and --init-strategies at once with the tree engine"
+    )
+    parser.add_argument("--antes", type=float, nargs="+", default=[1], help="Antes of the batched variants")
+    parser.add_argument("--bets", type=float, nargs="+", default=[1], help="Bet sizes of the batched variants")
+    parser.add_argument(
+        "--init-strategies", choices=["uniform", "specific"], nargs="+", default=["uniform"],
+        help="Initial strategies of the batched variants (specific: setInitialStrategiesToSpecificValues)"
+    )
+    parser.add_argument(
+        "--batch-output", type=str, default="strategy_batch.json", help="One strategy per batched variant"
+    )
+    parser.add_argument(
+        "--metrics-path", type=str, default="khun_poker.metrics.csv", help="Convergence log"
+    )
+    parser.add_argument(
+        "--no-plot", action="store_true", help="Headless run: do not plot the convergence log (matplotlib is never imported)"
+    )
+
+    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
+
+    numIterations = args["iterations"]
+
+    numGainsToPrint = 500_000
+    gainGrpSize = numIterations // numGainsToPrint
+    if gainGrpSize == 0:
+        gainGrpSize = 1
+
+    if args["batched"] and args["engine"] != "tree":
+        parser.error("--batched needs the tree engine")
+
+    with MetricsLog(args["metrics_path"]) as metrics:
+        if args["batched"]:
+            train_batched(numIterations, gainGrpSize, metrics, args["variant"], args["antes"], args["bets"],
+                          args["init_strategies"], args["batch_output"])
+        elif args["engine"] == "tree":
+            train_tree(numIterations, gainGrpSize, metrics, args["variant"])
+        else:
+            train_legacy(numIterations, gainGrpSize, metrics)
 
-        # Display the plot
-        plt.show()
+    if not args["no_plot"]:
+        plot_metrics(args["metrics_path"])
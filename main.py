@@ -1,160 +1,375 @@
 import argparse
+import os
 import sys
 import random
-from itertools import product
+from itertools import permutations
+from math import perm
 from functools import lru_cache
+from collections.abc import Mapping
 
 import json
 
 import numpy as np
-import matplotlib.pyplot as plt
 
-
-# Historic will be a simple string of numbers, where the firs number is the number of coins choosen by the current player,
-# and the following numbers are the guesses of the other players
+from historic_codec import encode_historic, decode_historic, pack_historic, pack_historic_codes
+from best_response import BestResponseTree
+from extensive_form import CFR_VARIANTS, DCFR_ALPHA, DCFR_BETA, DCFR_GAMMA, TreeCFR, compile_game, regret_matching
+from games import CoinGame
+from parallel_cfr import ParallelCFR
+import strategy_format
+from metrics_log import MetricsLog, first_iteration_below, plot_metrics, read_metrics, read_run_info
+from profiler import CFR_PHASES, MCCFR_PHASES, TREE_PHASES, Profiler
+
+
+# Historic will be a tuple of numbers, where the firs number is the number of coins choosen by the current player,
+# and the following numbers are the guesses of the other players (see historic_codec.py for the string keys used in files)
+
+class InfoSetStore:
+    # Dense storage for every infoset of the game. Infosets get an integer id at init_info_sets() time (in
+    # depth order) and every per-action quantity lives in a (num_infosets, num_actions) array, where the
+    # column is the guessed sum itself. Illegal actions are kept as padding and masked out with `legal`.
+    def __init__(self, historics: list, num_actions: int, init_strat_val: float):
+        self.historics = list(historics)
+        self.index: dict[tuple, int] = {historic: i for i, historic in enumerate(self.historics)}
+
+        num_infosets = len(self.historics)
+        self.num_actions = num_actions
+
+        # Legal actions, both as a mask and as CSR index arrays: the actions of infoset i are
+        # legal_actions[legal_offsets[i]:legal_offsets[i + 1]]
+        self.legal = np.zeros((num_infosets, num_actions), dtype=bool)
+        self.legal_actions = np.zeros(0, dtype=np.intp)
+        self.legal_offsets = np.zeros(num_infosets + 1, dtype=np.intp)
+        self.num_legal = np.zeros(num_infosets, dtype=np.intp)
+        self.strategy = np.full((num_infosets, num_actions), init_strat_val)
+        self.cumulativeGain = np.full((num_infosets, num_actions), init_strat_val)
+        self.util = np.zeros((num_infosets, num_actions))
+        self.beliefs = np.zeros((num_infosets, num_actions))
+        self.expectedUtil = np.zeros(num_infosets)
+        self.likelihood = np.zeros(num_infosets)
+        self.gain = np.zeros(num_infosets)
+        # Probability that the other seats lead to each infoset (the normalizer of its beliefs)
+        self.reach = np.zeros(num_infosets)
+        # Number of finished iterations, kept as an array so it can live in shared memory with the rest
+        self.iterations = np.zeros(1, dtype=np.int64)
+        # Running sum of the strategies played, for solvers that output the average policy
+        self.strategySum = np.zeros((num_infosets, num_actions))
+
+    def set_legal_actions(self, actions_per_infoset: list):
+        legal = np.zeros_like(self.legal)
+        for idx, actions in enumerate(actions_per_infoset):
+            legal[idx, actions] = True
+        self.set_legal(legal)
+
+    def set_legal(self, legal: np.ndarray):
+        self.legal = legal
+        self.num_legal = self.legal.sum(axis=1)
+        self.legal_offsets = np.concatenate(([0], np.cumsum(self.num_legal)))
+        self.legal_actions = np.flatnonzero(self.legal) % self.num_actions
+
+    def actions_of(self, idx: int) -> np.ndarray:
+        return self.legal_actions[self.legal_offsets[idx]:self.legal_offsets[idx + 1]]
+
+    def __len__(self):
+        return len(self.historics)
+
+
+# The classes below are thin views over the InfoSetStore, kept so code written against the old dict of objects
+# (save_strategy, the play scripts, debugging sessions) keeps working. They accept both historic tuples and the
+# string keys used in the strategy files.
 
 class InfoSetData:
-    def __init__(self, historic: str, num_coins: int, num_players: int):
+    def __init__(self, store: InfoSetStore, idx: int):
+        self.store = store
+        self.idx = idx
+        self.actions = InfoSetActions(store, idx)
 
-        actions = [str(i) for i in range(0, pow(num_players, num_coins) + 1)]
+    @property
+    def beliefs(self) -> dict[int, float]:
+        return {i: float(b) for i, b in enumerate(self.store.beliefs[self.idx])}
 
-        for j in range(len(actions), 0):
-            if historic[1:].find(str(j)) != -1:
-                actions.pop(j)
+    @property
+    def expectedUtil(self) -> float:
+        return float(self.store.expectedUtil[self.idx])
 
-        self.actions: dict[int, InfoSetActionData] = {
-            i: InfoSetActionData(initStratVal=1 / len(actions)) for i in actions
-        }
+    @property
+    def likelihood(self) -> float:
+        return float(self.store.likelihood[self.idx])
+
+
+class InfoSetActions(Mapping):
+    def __init__(self, store: InfoSetStore, idx: int):
+        self.store = store
+        self.idx = idx
+
+    def __getitem__(self, action: int | str):
+        # Only the legal actions are keys, like the per-infoset dicts this view replaces
+        try:
+            action_idx = int(action)
+        except ValueError:
+            raise KeyError(action) from None
+        if not 0 <= action_idx < self.store.num_actions or not self.store.legal[self.idx, action_idx]:
+            raise KeyError(action)
+        return InfoSetActionData(self.store, self.idx, action_idx)
 
-        self.beliefs: dict[str, float] = {}
-        self.expectedUtil: float = None
-        self.likelihood: float = None
+    def __iter__(self):
+        return (int(a) for a in self.store.actions_of(self.idx))
+
+    def __len__(self):
+        return int(self.store.num_legal[self.idx])
 
 
 class InfoSetActionData:
-    def __init__(self, initStratVal: float):
-        self.strategy = initStratVal
-        self.util = None
-        self.cumulativeGain = initStratVal
+    def __init__(self, store: InfoSetStore, idx: int, action_idx: int):
+        self.store = store
+        self.idx = idx
+        self.action_idx = action_idx
+
+    @property
+    def strategy(self) -> float:
+        return float(self.store.strategy[self.idx, self.action_idx])
+
+    @strategy.setter
+    def strategy(self, value: float):
+        self.store.strategy[self.idx, self.action_idx] = value
+
+    @property
+    def util(self) -> float:
+        return float(self.store.util[self.idx, self.action_idx])
+
+    @property
+    def cumulativeGain(self) -> float:
+        return float(self.store.cumulativeGain[self.idx, self.action_idx])
+
+    @cumulativeGain.setter
+    def cumulativeGain(self, value: float):
+        self.store.cumulativeGain[self.idx, self.action_idx] = value
+
+
+class InfoSetView(Mapping):
+    def __init__(self, store: InfoSetStore):
+        self.store = store
+
+    def __getitem__(self, historic: tuple | str) -> InfoSetData:
+        if isinstance(historic, str):
+            historic = decode_historic(historic, self.store.num_actions)
+        return InfoSetData(self.store, self.store.index[historic])
+
+    def __iter__(self):
+        return iter(self.store.historics)
+
+    def __len__(self):
+        return len(self.store)
+
+
+# Update rules that keep negative cumulative gains, the only ones regret-based pruning can cut guesses for
+REGRET_PRUNING_VARIANTS = ("dcfr", "linear")
+# Per-infoset values an incremental iteration may reuse from the previous one
+DIRTY_CACHED = ("beliefs", "reach", "util", "expectedUtil", "likelihood")
+# Entries of the get_coin_sum_counts cache, each one is an array of at most P * C + 1 counts
+COIN_SUM_CACHE_SIZE = 64
 
 
 class CFR:
-    def __init__(self, number_coins, number_players):
+    dcfr_alpha = DCFR_ALPHA
+    dcfr_beta = DCFR_BETA
+    dcfr_gamma = DCFR_GAMMA
+
+    # vanilla: gains (util - expectedUtil) are clipped at zero, weighted by the likelihood and accumulated, and the
+    #          current strategy is the output
+    #
+    # The other variants accumulate signed counterfactual gains: the value of guessing a under the beliefs minus
+    # the value of the strategy, weighted by the reach of the other seats. (The vanilla util already carries the
+    # strategy as a factor, which makes an action absorbing once signed gains drive it to zero probability.)
+    # cfr+: cumulative gains floored at zero, linearly weighted average strategy
+    # dcfr: positive / negative cumulative gains discounted by t^a/(t^a+1) and t^b/(t^b+1), average strategy
+    #       discounted by (t/(t+1))^g
+    # linear: gains weighted by t, linearly weighted average strategy
+    #
+    # With dirty_epsilon set, iteration() only recomputes the beliefs, utilities and likelihoods that can have
+    # moved: a row counts as changed once its strategy drifted more than dirty_epsilon from the one last
+    # propagated, and only the rows reading a changed strategy (or likelihood) are updated. Gains and strategies
+    # are still updated everywhere from the cached values. Every full_sweep_every iterations everything is
+    # recomputed, so the cached values are never more than that many iterations old.
+    #
+    # Pruning skips the same recomputations for whole subtrees:
+    # prune: regret-based pruning (dcfr, linear). When no coin of a seat can guess a at a public node for the
+    #        next k iterations (its cumulative gain is negative and, even if every one of those iterations brings the
+    #        largest possible gain, stays below zero while another guess stays positive), nobody reaches the infosets
+    #        below that guess during those k iterations. Their beliefs and utilities are exactly zero then, so the
+    #        result is the same as without pruning. Vanilla gains are never negative and cfr+ floors its cumulative gains
+    #        at zero, so neither ever has a guess to cut.
+    # prune_likelihood: infosets whose gain weight (likelihood for vanilla, reach otherwise) is below the threshold
+    #        keep their cached values for prune_recheck iterations. Their gains are at most the threshold times the
+    #        largest utility, which bounds the error this adds to the cumulative gains.
+    prune_check_every = 10
+    prune_max = 1000
+
+    def __init__(self, number_coins, number_players, variant="vanilla", average_policy=None,
+                 dirty_epsilon=None, full_sweep_every=100, prune=False, prune_likelihood=None, prune_recheck=100):
+        if variant not in CFR_VARIANTS:
+            raise ValueError(f"Unknown CFR variant {variant}")
+        if prune and variant not in REGRET_PRUNING_VARIANTS:
+            raise ValueError(f"Regret-based pruning never cuts anything with the {variant} variant")
+
         self.number_coins = number_coins
         self.number_players = number_players
 
+        self.variant = variant
+        # Only vanilla writes its current strategy by default, the other variants converge in average
+        self.average_policy = variant != "vanilla" if average_policy is None else average_policy
+
         self.coins = [i for i in range(0, number_coins + 1)]
 
-        self.infoSets: dict[str, InfoSetData] = {}
-        self.sorted_infoSets: list = []
+        self.num_actions = number_players * number_coins + 1
 
-        self.coin_sum_prior : dict[str, list] = {}
+        self.store: InfoSetStore = None
+        self.infoSets: InfoSetView = None
+        self.sorted_infoSets: list = []
 
-    def init_info_sets(self):
+        self.coin_sum_prior : dict[int, list] = {}
 
-        # Fist Player to act
-        full_historics = []
-        for i in range(0, self.number_coins + 1):
-            full_historics.append(str(i))
-            self.infoSets[str(i)] = InfoSetData(str(i), self.number_coins, self.number_players)
-        
-        # Other players
+        self.dirty_epsilon = dirty_epsilon
+        self.full_sweep_every = full_sweep_every
+        # Strategy last propagated to the dependent rows, and how many rows the last iteration recomputed
+        self.published: np.ndarray = None
+        self.touched: dict[str, int] = None
 
-        historics = [str(i) for i in range(0, self.number_players * self.number_coins + 1)]
+        self.prune = prune
+        self.prune_likelihood = prune_likelihood
+        self.prune_recheck = prune_recheck
+        # Rows are skipped by iterations t < pruned_until[row]
+        self.pruned_until: np.ndarray = None
 
-        for j in range(1, self.number_players - 1):
-            for hist in historics:    
-                if len(hist) == j:
-                    for k in range(0, self.number_players * self.number_coins + 1):
-                        if hist.find(str(k)) == -1:
-                            historic = hist + str(k)
-                            historics.append(historic)
+    @property
+    def tracks_rows(self) -> bool:
+        # Dirty tracking and pruning both go through incremental_iteration()
+        return self.dirty_epsilon is not None or self.prune or self.prune_likelihood is not None
 
-        for hist in historics:
-            for nc in range(0, self.number_coins + 1):
-                full_hist = str(nc) + hist
-                full_historics.append(full_hist)
-                self.infoSets[full_hist] = InfoSetData(full_hist, self.number_coins, self.number_players)
+    def iter_historics(self):
+        # Depth order: every sequence of distinct guesses in lexicographic order, then every coin of the seat to guess
+        for depth in range(0, self.number_players):
+            for guesses in permutations(range(0, self.num_actions), depth):
+                for coin in self.coins:
+                    yield (coin,) + guesses
 
-        self.sorted_infoSets = sorted(full_historics, key=lambda x: len(x))
-        
-        for coin in range(0, self.number_coins + 1):
-            all_combinations = product(range(self.number_coins + 1), repeat=self.number_players)
-            sum_counter = {str(i) : 0 for i in range(0, self.number_players * self.number_coins + 1)}
-            possible_sum = self.get_possible_coins_sum(coin)
-            comb_tot = 0
-            for comb in all_combinations:
-                comb_sum = sum(comb)
-                if str(comb_sum) not in possible_sum:
-                    continue
-
-                sum_counter[str(comb_sum)] += 1
-                comb_tot += 1
-            
-            self.coin_sum_prior[str(coin)] = [sum_counter[str(i)] / comb_tot for i in range(0, self.number_players * self.number_coins + 1)]
+    def init_info_sets(self):
+        # Ids follow iter_historics(), so every depth level is a contiguous block of rows
+        self.store = InfoSetStore(self.iter_historics(), self.num_actions, 1 / self.num_actions)
+        self.infoSets = InfoSetView(self.store)
+        self.sorted_infoSets = self.store.historics
+
+        # A level holds (C + 1) * A! / (A - depth)! infosets
+        num_coins = self.number_coins + 1
+        level_sizes = [num_coins * perm(self.num_actions, depth) for depth in range(0, self.number_players)]
+        level_bounds = np.concatenate(([0], np.cumsum(level_sizes)))
+        self.level_slices = [slice(int(start), int(end)) for start, end in zip(level_bounds[:-1], level_bounds[1:])]
+        self.depths = np.repeat(np.arange(0, self.number_players), level_sizes)
+        self.coin_choosen = np.tile(np.arange(0, num_coins), len(self.store) // num_coins)
+
+        # Legality is derived once here, every later phase reads the tables in the store
+        legal = np.ones((len(self.store), self.num_actions), dtype=bool)
+        self.last_guess = np.full(len(self.store), -1, dtype=np.intp)
+        for depth, level in enumerate(self.level_slices[1:], start=1):
+            guesses = np.repeat(np.array(list(permutations(range(0, self.num_actions), depth))), num_coins, axis=0)
+            legal[np.arange(level.start, level.stop)[:, None], guesses] = False
+            self.last_guess[level] = guesses[:, -1]
+        self.store.set_legal(legal)
+
+        if self.variant != "vanilla":
+            # Regret matching variants start from zero gains and the uniform strategy over legal actions
+            self.store.cumulativeGain[...] = 0
+            self.store.strategy[...] = self.store.legal / self.store.num_legal[:, None]
+
+        sum_counts = get_coin_sum_counts(self.number_players, self.number_coins)
+        for coin in self.coins:
+            possible_sum = np.asarray(self.get_possible_coins_sum(coin))
+            sum_counter = np.zeros(self.num_actions, dtype=np.int64)
+            sum_counter[possible_sum] = sum_counts[possible_sum]
+            self.coin_sum_prior[coin] = (sum_counter / sum_counter.sum()).tolist()
+
+        self._build_graph()
+        self._build_belief_tables()
+
+        if self.tracks_rows:
+            self._build_dirty_tables()
+
+    def _build_graph(self):
+        # Index graph of the infosets, built once and shared by the phases that walk the tree:
+        # - guess_rank[r]: rank of the guesses of row r among the guess sequences of its depth. Rows come in blocks of
+        #   C + 1 (one per coin) in lexicographic guess order, so r = level start + rank * (C + 1) + coin, and the rank
+        #   of the first i guesses is rank // perm(A - i, depth - i) (see ancestor_rows).
+        # - last_guess[r]: the guess leading to row r (-1 for the roots), set by init_info_sets.
+        # - prev_rows[r], prev_actions[r]: the rows and actions whose likelihood * strategy sum to the likelihood of
+        #   row r (get_prev_info_states_hist), prev_rows is the row itself for the roots.
+        store = self.store
+        num_coins = self.number_coins + 1
+        level_starts = np.array([level.start for level in self.level_slices])
+        self.guess_rank = (np.arange(len(store)) - level_starts[self.depths]) // num_coins
+
+        self.prev_rows = np.repeat(np.arange(len(store))[:, None], self.number_coins, axis=1)
+        self.prev_actions = np.zeros((len(store), self.number_coins), dtype=np.intp)
+        for idx in range(self.level_slices[0].stop, len(store)):
+            prev_states = self.get_prev_info_states_hist(store.historics[idx])
+            self.prev_rows[idx] = [store.index[prev] for prev in prev_states]
+            self.prev_actions[idx] = [prev[-1] for prev in prev_states]
+
+    def ancestor_rows(self, rows: np.ndarray, depth: int) -> np.ndarray:
+        # (len(rows), C + 1) rows at `depth` that share the first `depth` guesses of each row, one per coin
+        row_depths = self.depths[rows]
+        divisor = np.array([perm(self.num_actions - depth, d - depth) for d in range(depth, self.number_players)])
+        rank = self.guess_rank[rows] // divisor[row_depths - depth]
+        return self.level_slices[depth].start + rank[:, None] * (self.number_coins + 1) + np.arange(self.number_coins + 1)
 
     # This two functions change the state into the oponents prespective, changing the priviledge info and maintaining the public knowledge
-    def get_prev_info_states_hist(self, historic : str):
+    def get_prev_info_states_hist(self, historic : tuple):
         if len(historic) == 1:
             raise ValueError(f"No ancestors for infoset={historic}")
-        return [str(i) + historic[-1:1] for i in range(0, self.number_coins)]
+        return [(i,) + historic[-1:1] for i in range(0, self.number_coins)]
 
-    def get_next_info_states_hist(self, historic, action):
+    def get_next_info_states_hist(self, historic : tuple, action : int):
         if len(historic) == 1:
-            return [str(i) + action for i in range(0, self.number_coins)]
+            return [(i, action) for i in range(0, self.number_coins)]
         
-        return [str(i) + historic[-1:] + action for i in range(0, self.number_coins)]
+        return [(i,) + historic[-1:] + (action,) for i in range(0, self.number_coins)]
 
-    def get_possible_actions(self, historic):
-        actions = [str(i) for i in range(0, self.number_players * self.number_coins + 1)]
+    def get_possible_actions(self, historic : tuple):
+        guesses = historic[1:]
+        return [i for i in range(0, self.num_actions) if i not in guesses]
 
-        for j in reversed(range(0, len(actions))):
-            if historic[1:].find(str(j)) != -1:
-                actions.pop(j)
+    def get_legal_actions(self, historic : tuple) -> np.ndarray:
+        return self.store.actions_of(self.store.index[historic])
 
-        return actions
+    def is_legal_action(self, historic : tuple, action : int) -> bool:
+        return 0 <= action < self.num_actions and bool(self.store.legal[self.store.index[historic], action])
  
     def get_possible_coins_sum(self, coin_choosen):
-        return [str(i) for i in range(coin_choosen, (self.number_players - 1) * self.number_coins + 1 + coin_choosen)]
+        return range(coin_choosen, (self.number_players - 1) * self.number_coins + 1 + coin_choosen)
+
+    def historic_key(self, historic : tuple) -> str:
+        return encode_historic(historic, self.num_actions)
+
+    def parse_historic_key(self, key : str) -> tuple:
+        return decode_historic(key, self.num_actions)
 
     def update_utilities_of_info_states(self, historic):
-        playerIdx = len(historic) - 1
-        infoSet = self.infoSets[historic]
-        beliefs = infoSet.beliefs
-
-        possible_actions = self.get_possible_actions(historic)
-
-        for action in possible_actions:
-            # full_action = historic + action
-            # next_states = self.get_next_info_states_hist(historic, action)
-            utils_info_states, utils_terminal_state = 0, 0
-
-            prob_action = infoSet.actions[action].strategy
-
-            for i in range(0, self.number_players * self.number_coins + 1):
-                prob_state = beliefs[str(i)]
-
-                if action == str(i):
-                    utils_player = self.number_players - 1
-                else:
-                    utils_player = -1
-
-                utils_terminal_state += prob_state * prob_action *utils_player
-                
-                # if len(full_action) == self.number_players + 1:
-                #     utils = self.calc_util_terminal_node(full_action, str(i))
-                #     utils_terminal_state += prob_state * utils[playerIdx]
-                # else:
-                #     for next_state in next_states:
-                #         next_state_info_set = self.infoSets[next_state]
-                #         utils_info_states += prob_state * prob_action * next_state_info_set.expectedUtil
-
-            infoSet.actions[action].util = utils_terminal_state + utils_info_states
-
-        infoSet.expectedUtil = 0
-        for action in possible_actions:
-            actionData = infoSet.actions[action]
-            infoSet.expectedUtil += actionData.strategy * actionData.util                    
+        self._update_utilities(self.store.index[historic])
+
+    def update_utilities(self):
+        # Utilities only depend on the infoset's own beliefs and strategy, so every infoset is updated at once
+        self._update_utilities(slice(None))
+
+    def _update_utilities(self, rows):
+        store = self.store
+        beliefs = store.beliefs[rows]
+        strategy = store.strategy[rows]
+
+        # Guessing sum a pays P - 1 with probability beliefs[a] and -1 otherwise
+        total_belief = beliefs.sum(axis=-1, keepdims=True)
+        util = strategy * (self.number_players * beliefs - total_belief)
+
+        store.util[rows] = np.where(store.legal[rows], util, 0.0)
+        store.expectedUtil[rows] = (strategy * store.util[rows]).sum(axis=-1)
     
     def calc_util_terminal_node(self, historic, sum_coins):
         guesses = historic[1:]
@@ -168,80 +383,495 @@ class CFR:
             
         return [0] * self.number_players
     
-    def calc_infoset_likelihoods(self):
+    def calc_infoset_likelihoods(self, rows=slice(None)):
+        # rows is a slice or an array of row ids. Level by level over the index graph, so the previous rows are
+        # always up to date when a level reads them.
+        store = self.store
+        rows = np.arange(len(store))[rows]
+        row_depths = self.depths[rows]
+
+        store.likelihood[rows[row_depths == 0]] = 1 / (self.number_coins + 1)
+        for depth in range(1, self.number_players):
+            level_rows = rows[row_depths == depth]
+            prev, actions = self.prev_rows[level_rows], self.prev_actions[level_rows]
+            store.likelihood[level_rows] = (store.likelihood[prev] * store.strategy[prev, actions]).sum(axis=1)
 
-        for historic in self.sorted_infoSets:
-            state = self.infoSets[historic]
-            state.likelihood = 0
+    def update_beliefs(self):
+        for belief_level in self.belief_levels:
+            self.update_level_beliefs(belief_level)
+
+    def update_level_beliefs(self, belief_level):
+        # belief_level is one entry of belief_levels, or a slice of its rows (see parallel_cfr.py)
+        rows, seat_idx, scale, sum_cols, prior = belief_level
+        if len(rows) == 0:
+            return
+
+        store = self.store
+        flat_strategy = store.strategy.ravel()
+        depth = seat_idx.shape[1]
+
+        # P(opponent coin sum) as a DP over the seats that already guessed: seat i holding `coin` multiplies by the
+        # probability of its guess from that coin and shifts the sum by `coin`. The seats still to guess add every
+        # coin with the same weight, they start the DP as the number of ways to reach each sum.
+        seat_probs = flat_strategy[seat_idx]
+        free_counts = get_coin_sum_counts(self.number_players - 1 - depth, self.number_coins)
+        probs_sum = np.broadcast_to(free_counts * 1.0, (len(rows), len(free_counts)))
+        for i in range(0, depth):
+            shifted = np.zeros((len(rows), probs_sum.shape[1] + self.number_coins))
+            for coin in self.coins:
+                shifted[:, coin:coin + probs_sum.shape[1]] += probs_sum * seat_probs[:, i, coin, None]
+            probs_sum = shifted
+        probs_sum = probs_sum * scale[:, None]
+        prob_state = probs_sum.sum(axis=1, keepdims=True)
+        store.reach[rows] = prob_state[:, 0]
+        # Infosets the other seats never lead to (possible once a strategy puts zero mass on a guess) get no beliefs
+        prob_state = np.where(prob_state > 0, prob_state, 1)
+
+        store.beliefs[rows] = 0
+        store.beliefs[rows[:, None], sum_cols] = probs_sum * prior / prob_state
+
+    def _build_belief_tables(self):
+        # Precomputes, for every depth level, which strategy entries make up the probability of each opponent
+        # coin sum: seat i < playerIdx guessed historic[i+1] from infoset (coin,) + historic[1:i+1], seats after
+        # the current player are assumed uniform over the current legal actions.
+        store = self.store
+        num_opponents = self.number_players - 1
+
+        prior_table = np.array([self.coin_sum_prior[coin] for coin in self.coins])
+        sum_offsets = np.arange(num_opponents * self.number_coins + 1)
+
+        self.belief_levels = []
+        # belief_upstream[l][r] are the rows whose strategies the beliefs of row r of level l read
+        self.belief_upstream = []
+        for depth in range(0, self.number_players):
+            rows = np.flatnonzero(self.depths == depth)
+            if len(rows) == 0:
+                continue
+
+            # opp_flat[r, i, coin] is the flat strategy index of seat i's guess when seat i holds `coin`
+            opp_flat = np.empty((len(rows), depth, self.number_coins + 1), dtype=np.intp)
+            for i in range(0, depth):
+                guess = self.last_guess[self.ancestor_rows(rows, i + 1)[:, 0]]
+                opp_flat[:, i] = self.ancestor_rows(rows, i) * self.num_actions + guess[:, None]
+
+            num_possible_actions = store.num_legal[rows]
+            scale = (1 / (self.number_coins + 1)) * (1 / num_possible_actions) ** (num_opponents - depth)
+
+            sum_cols = self.coin_choosen[rows][:, None] + sum_offsets[None, :]
+            prior = prior_table[self.coin_choosen[rows][:, None], sum_cols]
+
+            self.belief_levels.append((rows, opp_flat, scale, sum_cols, prior))
+            self.belief_upstream.append(opp_flat.reshape(len(rows), -1) // self.num_actions)
+
+    def _build_dirty_tables(self):
+        store = self.store
+        self.published = store.strategy.copy()
+        self.pruned_until = np.zeros(len(store), dtype=np.int64)
+
+        # Largest reach of every row: seats before it contribute at most 1 per coin, the later seats (C+1)/legal
+        self.reach_bound = np.zeros(len(store))
+        for belief_level in self.belief_levels:
+            rows, scale = belief_level[0], belief_level[2]
+            self.reach_bound[rows] = scale * (self.number_coins + 1) ** (self.number_players - 1)
+
+        # node_rows[n] are the rows of public node n (the guesses made so far), one per coin of the seat to guess:
+        # the blocks of C + 1 rows of the index graph. prune_paths[r] are the (node, guess) edges leading to row r,
+        # as flat node * num_actions + guess indices padded with an index past the last edge
+        num_coins = self.number_coins + 1
+        self.node_rows = np.arange(len(store)).reshape(-1, num_coins)
+
+        self.prune_paths = np.full((len(store), max(self.number_players - 1, 1)), len(self.node_rows) * self.num_actions,
+                                   dtype=np.intp)
+        for depth, level in enumerate(self.level_slices):
+            rows = np.arange(level.start, level.stop)
+            for i in range(0, depth):
+                guess = self.last_guess[self.ancestor_rows(rows, i + 1)[:, 0]]
+                self.prune_paths[rows, i] = self.ancestor_rows(rows, i)[:, 0] // num_coins * self.num_actions + guess
+
+    @property
+    def t(self) -> int:
+        # 1-based number of the iteration being run
+        return int(self.store.iterations[0]) + 1
+
+    def calc_gains(self, rows=slice(None)):
+        store = self.store
+        t = self.t
+
+        if self.variant == "vanilla":
+            gains = np.maximum(0, store.util[rows] - store.expectedUtil[rows, None])
+            gains[~store.legal[rows]] = 0
+            store.cumulativeGain[rows] += gains * store.likelihood[rows, None]
+        else:
+            beliefs = store.beliefs[rows]
+            action_value = self.number_players * beliefs - beliefs.sum(axis=1, keepdims=True)
+            strategy_value = (store.strategy[rows] * action_value).sum(axis=1, keepdims=True)
+            instant = np.where(store.legal[rows], action_value - strategy_value, 0.0)
+            gains = np.maximum(0, instant)
+            weighted = instant * store.reach[rows, None]
+
+            if self.variant == "cfr+":
+                store.cumulativeGain[rows] = np.maximum(store.cumulativeGain[rows] + weighted, 0)
+            elif self.variant == "linear":
+                store.cumulativeGain[rows] += t * weighted
+            elif self.variant == "dcfr":
+                cumulative = store.cumulativeGain[rows]
+                positive_discount = t ** self.dcfr_alpha / (t ** self.dcfr_alpha + 1)
+                negative_discount = t ** self.dcfr_beta / (t ** self.dcfr_beta + 1)
+                cumulative *= np.where(cumulative > 0, positive_discount, negative_discount)
+                store.cumulativeGain[rows] = cumulative + weighted
+
+        # The total is always summed from the per-infoset gains, so splitting the rows never changes it
+        store.gain[rows] = gains.sum(axis=1)
+        return float(store.gain[rows].sum())
+    
+    def update_strat(self, rows=slice(None)):
+        store = self.store
+        t = self.t
+
+        # The strategy that was just played goes into the average before being replaced
+        if self.variant == "vanilla":
+            store.strategySum[rows] += store.strategy[rows]
+        elif self.variant == "dcfr":
+            store.strategySum[rows] = store.strategySum[rows] * (t / (t + 1)) ** self.dcfr_gamma + store.strategy[rows]
+        else:
+            store.strategySum[rows] += t * store.strategy[rows]
+
+        if self.variant == "vanilla":
+            gains = np.where(store.legal[rows], store.cumulativeGain[rows], 0.0)
+            totGains = gains.sum(axis=1, keepdims=True)
+            store.strategy[rows] = np.where(store.legal[rows], gains / totGains, store.strategy[rows])
+        else:
+            store.strategy[rows] = regret_matching(store.cumulativeGain[rows], store.legal[rows], store.num_legal[rows])
+
+    def average_strategy(self) -> np.ndarray:
+        store = self.store
+        return regret_matching(store.strategySum, store.legal, store.num_legal)
+
+    def policy(self) -> np.ndarray:
+        # The strategy written by save_strategy and scored by the exploitability check
+        return self.average_strategy() if self.average_policy else self.store.strategy
+
+    def load_initial_strategy(self, strategy: Mapping) -> int:
+        # Warm start from a saved {infoset key: {action: probability}} table (JSON or binary, see strategy_format.py).
+        # The cumulative gains are seeded with the strategy itself, so the update rule gives it back until new gains
+        # come in. Infosets missing from the table keep the uniform start. Returns the number of infosets seeded.
+        store = self.store
+        seeded = 0
+        for idx, historic in enumerate(store.historics):
+            key = self.historic_key(historic)
+            if key not in strategy:
+                continue
+
+            probs = np.zeros(self.num_actions)
+            for action, prob in strategy[key].items():
+                probs[int(action)] = prob
+            probs = np.where(store.legal[idx], probs, 0.0)
+            if probs.sum() <= 0:
+                continue
+
+            store.strategy[idx] = np.where(store.legal[idx], probs / probs.sum(), store.strategy[idx])
+            store.cumulativeGain[idx] = np.where(store.legal[idx], store.strategy[idx], 0.0)
+            seeded += 1
+        return seeded
+
+    def checkpoint_state(self) -> dict:
+        # Strategy and cumulativeGain are the only state carried between iterations (beliefs, utilities and
+        # likelihoods are recomputed from the strategy), so they are enough to resume bit for bit.
+        state = {
+            'strategy': self.store.strategy,
+            'cumulativeGain': self.store.cumulativeGain,
+            'strategySum': self.store.strategySum,
+            'iterations': self.store.iterations,
+        }
+        if self.tracks_rows:
+            # Incremental iterations also reuse the values they skipped recomputing
+            state.update({name: getattr(self.store, name) for name in DIRTY_CACHED})
+            state['published'] = self.published
+            state['pruned_until'] = self.pruned_until
+        return state
+
+    def load_checkpoint_state(self, checkpoint):
+        self.store.strategy[...] = checkpoint['strategy']
+        self.store.cumulativeGain[...] = checkpoint['cumulativeGain']
+        self.store.strategySum[...] = checkpoint['strategySum']
+        self.store.iterations[...] = checkpoint['iterations']
+        if self.tracks_rows and 'published' in checkpoint:
+            for name in DIRTY_CACHED:
+                getattr(self.store, name)[...] = checkpoint[name]
+            self.published[...] = checkpoint['published']
+            self.pruned_until[...] = checkpoint['pruned_until']
+        elif self.tracks_rows:
+            # Nothing cached in the checkpoint, start with a full sweep
+            self.published = None
+            self.pruned_until[...] = 0
+
+    def update_dirty_beliefs(self, changed: np.ndarray, forced: np.ndarray, active: np.ndarray) -> np.ndarray:
+        # Recomputes the beliefs of the active rows that are forced or read a changed strategy, returns their ids
+        updated = []
+        for belief_level, upstream in zip(self.belief_levels, self.belief_upstream):
+            rows = belief_level[0]
+            dirty = (forced[rows] | changed[upstream].any(axis=1)) & active[rows]
+            if dirty.all():
+                self.update_level_beliefs(belief_level)
+            elif dirty.any():
+                self.update_level_beliefs(tuple(table[dirty] for table in belief_level))
+            updated.append(belief_level[0][dirty])
+        return np.concatenate(updated)
+
+    def update_dirty_likelihoods(self, changed: np.ndarray, forced: np.ndarray, active: np.ndarray) -> int:
+        # Level by level, so a likelihood that moved marks the rows below it; returns the number of rows updated
+        store = self.store
+        moved = np.zeros(len(store), dtype=bool)
+        touched = 0
+        for level in self.level_slices:
+            prev = self.prev_rows[level]
+            dirty = (forced[level] | (changed[prev] | moved[prev]).any(axis=1)) & active[level]
+            rows = level.start + np.flatnonzero(dirty)
+            old = store.likelihood[rows]
+            self.calc_infoset_likelihoods(rows)
+            moved[rows] = store.likelihood[rows] != old
+            touched += len(rows)
+        return touched
+
+    def _prune_horizons(self, cumulative: np.ndarray, bound: np.ndarray, negative: bool) -> np.ndarray:
+        # Number of iterations, from the next one on, during which each cumulative gain stays below zero (negative)
+        # or above zero whatever the gains are: one iteration moves it by at most `bound` times the variant's weight
+        values = cumulative.copy()
+        alive = values < 0 if negative else values > 0
+        horizon = np.zeros(values.shape, dtype=np.int64)
+
+        for t in range(self.t, self.t + self.prune_max):
+            if not alive.any():
+                break
+            horizon += alive
+
+            if self.variant == "dcfr":
+                positive_discount = t ** self.dcfr_alpha / (t ** self.dcfr_alpha + 1)
+                negative_discount = t ** self.dcfr_beta / (t ** self.dcfr_beta + 1)
+                values = values * np.where(values > 0, positive_discount, negative_discount)
+            step = bound * (t if self.variant == "linear" else 1)
+            values = values + step if negative else values - step
+            if self.variant == "cfr+":
+                values = np.maximum(values, 0)
+
+            alive &= values < 0 if negative else values > 0
+
+        return horizon
+
+    def update_pruning(self):
+        store = self.store
+        t = self.t
+        active = self.pruned_until <= t
+        pruned = np.zeros(len(store), dtype=bool)
+
+        if self.prune:
+            bound = self.number_players * self.reach_bound[:, None]
+            negative = np.where(store.legal, self._prune_horizons(store.cumulativeGain, bound, True), 0)
+            positive = np.where(store.legal, self._prune_horizons(store.cumulativeGain, bound, False), 0)
+            # Regret matching only gives a guess zero probability while some other guess has a positive gain
+            horizon = np.minimum(negative, positive.max(axis=1, keepdims=True))
+
+            # An edge is cut while every coin of the seat avoids the guess, a row while any edge above it is cut
+            edge_horizon = np.append(horizon[self.node_rows].min(axis=1).ravel(), 0)
+            row_horizon = edge_horizon[self.prune_paths].max(axis=1)
+
+            pruned = active & (row_horizon > 0)
+            self.pruned_until[pruned] = t + row_horizon[pruned]
+            # This is what the beliefs and utilities of an unreachable row evaluate to
+            store.beliefs[pruned] = 0
+            store.reach[pruned] = 0
+            store.util[pruned] = 0
+            store.expectedUtil[pruned] = 0
+
+        if self.prune_likelihood is not None:
+            weight = store.likelihood if self.variant == "vanilla" else store.reach
+            light = active & ~pruned & (weight < self.prune_likelihood)
+            self.pruned_until[light] = t + self.prune_recheck
+
+    def incremental_iteration(self):
+        store = self.store
+        t = self.t
+
+        full = self.published is None or self.dirty_epsilon is None or (t - 1) % self.full_sweep_every == 0
+        if full:
+            changed = np.ones(len(store), dtype=bool)
+        else:
+            changed = np.abs(store.strategy - self.published).max(axis=1) > self.dirty_epsilon
+        if self.published is None:
+            self.published = store.strategy.copy()
+        self.published[changed] = store.strategy[changed]
+
+        # Pruned rows are left as they are, rows whose pruning just ended are recomputed from scratch
+        active = self.pruned_until <= t
+        forced = np.full(len(store), full) | (self.pruned_until == t)
+
+        belief_rows = self.update_dirty_beliefs(changed, forced, active)
+
+        # Utilities read the infoset's own beliefs and strategy
+        util_dirty = changed | forced
+        util_dirty[belief_rows] = True
+        util_rows = np.flatnonzero(util_dirty & active)
+        self._update_utilities(util_rows)
+
+        likelihood_rows = self.update_dirty_likelihoods(changed, forced, active)
+
+        totGain = self.calc_gains()
+
+        self.update_strat()
+
+        self.store.iterations += 1
+
+        if (self.prune or self.prune_likelihood is not None) and (self.t - 1) % self.prune_check_every == 0:
+            self.update_pruning()
+
+        self.touched = {
+            "beliefs": len(belief_rows), "utilities": len(util_rows), "likelihoods": likelihood_rows,
+            "pruned": int(len(store) - active.sum()),
+        }
+        return totGain
 
-            if len(historic) == 1:
-                state.likelihood = 1 / (self.number_coins + 1)
-            else:
-                prev_states = self.get_prev_info_states_hist(historic)
-                for prev_state in prev_states:
-                    state.likelihood += self.infoSets[prev_state].likelihood * self.infoSets[prev_state].actions[prev_state[-1]].strategy
+    def iteration(self):
+        if self.tracks_rows:
+            return self.incremental_iteration()
 
-    def update_beliefs(self):
-        for historic in self.sorted_infoSets:
-            state = self.infoSets[historic]
-
-            coin_choosen = int(historic[0])
-            playerIdx = len(historic) - 1
-
-            possible_sum_coins = self.get_possible_coins_sum(coin_choosen)
-
-            probs_sum = {str(i) : 0 for i in range(0, self.number_players * self.number_coins + 1)}
-
-            prob_state = 0
-            for coin_sum in possible_sum_coins:
-                coin_combs = get_coin_combinations(self.number_players - 1, int(coin_sum) - coin_choosen, self.number_coins)
-                prob_sum = 0
-                for comb in coin_combs:
-                    prob_comb = 1 / (self.number_coins + 1)
-                    for i in range(0, len(comb)):
-                        opp_historic = str(comb[i]) + historic[1:i+1]
-                        if i < playerIdx:
-                            opp_action = historic[i+1]
-                            prob_comb *= self.infoSets[opp_historic].actions[opp_action].strategy 
-                        else:
-                            possible_actions = self.get_possible_actions(historic)
-                            prob_comb *= 1 / len(possible_actions)
-                    
-                    prob_sum += prob_comb
-                    prob_state += prob_comb
-                
-                probs_sum[str(coin_sum)] = prob_sum
-            
-            for coin_sum in probs_sum.keys():
-                state.beliefs[coin_sum] = (probs_sum[coin_sum] * self.coin_sum_prior[str(coin_choosen)][int(coin_sum)]) / prob_state
+        self.update_beliefs()
 
-        return
-    
-    def calc_gains(self):
-        totalGain = 0.0
-
-        for historic in self.sorted_infoSets:
-            state = self.infoSets[historic]
-            possible_actions = self.get_possible_actions(historic)
-            for action in possible_actions:
-                util = state.actions[action].util
-                gain = max(0, util - state.expectedUtil)
-                totalGain += gain
-                state.actions[action].cumulativeGain += gain * state.likelihood
-        
-        return totalGain
-    
-    def update_strat(self):
-        for historic in self.sorted_infoSets:
-            state = self.infoSets[historic]
-            possible_actions = self.get_possible_actions(historic)
-            gains = [state.actions[action].cumulativeGain for action in possible_actions]
+        self.update_utilities()
+
+        self.calc_infoset_likelihoods()
+
+        totGain = self.calc_gains()
+
+        self.update_strat()
 
-            totGains = sum(gains)
+        self.store.iterations += 1
 
-            for action in possible_actions:
-                gain = state.actions[action].cumulativeGain
-                state.actions[action].strategy = gain / totGains
+        return totGain
+
+class MCCFR(CFR):
+    # Monte Carlo CFR on the same infosets as CFR. Instead of full-width passes over beliefs, each iteration samples
+    # batches of games for every seat in turn (the traverser) and updates the regrets of the infosets the samples
+    # went through, with regret matching for the current strategy and the average strategy as output.
+    #
+    # external: chance and the other seats are sampled, every legal guess of the traverser is evaluated.
+    # outcome: a single guess of the traverser is sampled with epsilon exploration and importance weighted.
+    #
+    # store.cumulativeGain holds the cumulative regrets and store.strategySum the running average strategy.
+    # A batch of samples is drawn from the same strategy and applied at once.
+    def __init__(self, number_coins, number_players, sampling="external", batch_size=1000, epsilon=0.6, seed=None):
+        super().__init__(number_coins, number_players)
+        if sampling not in ("external", "outcome"):
+            raise ValueError(f"Unknown sampling scheme {sampling}")
+
+        self.sampling = sampling
+        self.batch_size = batch_size
+        self.epsilon = epsilon
+        self.rng = np.random.default_rng(seed)
+
+    def init_info_sets(self):
+        super().init_info_sets()
+        self.store.cumulativeGain[...] = 0
+
+        codes = np.array([pack_historic(historic, self.num_actions) for historic in self.store.historics], dtype=np.int64)
+        self.code_order = np.argsort(codes)
+        self.sorted_codes = codes[self.code_order]
+
+    def _build_belief_tables(self):
+        # Beliefs are never materialized, the samples stand in for them
+        pass
+
+    def rows_of(self, coins, guess_codes, depth):
+        codes = pack_historic_codes(coins, guess_codes, depth, self.num_actions)
+        return self.code_order[np.searchsorted(self.sorted_codes, codes)]
+
+    def current_strategy(self, rows):
+        store = self.store
+        return regret_matching(store.cumulativeGain[rows], store.legal[rows], store.num_legal[rows])
+
+    def _sample(self, probs):
+        cdf = np.cumsum(probs, axis=1)
+        u = self.rng.random(len(probs)) * cdf[:, -1]
+        return (cdf <= u[:, None]).sum(axis=1)
+
+    def _play_seats(self, coins, guess_codes, guesses, seats):
+        # Samples the guesses of `seats` on-policy for every game of the batch, accumulating the average strategy
+        store = self.store
+        for seat in seats:
+            rows = self.rows_of(coins[:, seat], guess_codes, seat)
+            strategy = self.current_strategy(rows)
+            np.add.at(store.strategySum, rows, strategy)
+
+            guess = self._sample(strategy)
+            guesses[:, seat] = guess
+            guess_codes = guess_codes * self.num_actions + guess
+        return guess_codes
+
+    def _terminal_utils(self, coins, guesses, traverser):
+        # Same payoffs as calc_util_terminal_node, seen from the traverser
+        sum_coins = coins.sum(axis=1)
+        winners = guesses == sum_coins[:, None]
+        return np.where(winners[:, traverser], self.number_players - 1.0, np.where(winners.any(axis=1), -1.0, 0.0))
+
+    def _traverse(self, traverser):
+        store = self.store
+        n = self.batch_size
+
+        coins = self.rng.integers(0, self.number_coins + 1, size=(n, self.number_players))
+        guesses = np.zeros((n, self.number_players), dtype=np.int64)
+        guess_codes = self._play_seats(coins, np.zeros(n, dtype=np.int64), guesses, range(0, traverser))
+
+        rows = self.rows_of(coins[:, traverser], guess_codes, traverser)
+        legal = store.legal[rows]
+        strategy = self.current_strategy(rows)
+        later_seats = range(traverser + 1, self.number_players)
+
+        if self.sampling == "external":
+            # Every legal guess of the traverser, each followed by its own sample of the later seats
+            games, actions = np.nonzero(legal)
+            branch_guesses = guesses[games]
+            branch_guesses[:, traverser] = actions
+            branch_codes = guess_codes[games] * self.num_actions + actions
+            self._play_seats(coins[games], branch_codes, branch_guesses, later_seats)
+
+            action_utils = np.zeros((n, self.num_actions))
+            action_utils[games, actions] = self._terminal_utils(coins[games], branch_guesses, traverser)
+        else:
+            # One exploratory guess of the traverser, importance weighted by its sampling probability
+            explore = np.where(legal, self.epsilon / store.num_legal[rows][:, None] + (1 - self.epsilon) * strategy, 0.0)
+            actions = self._sample(explore)
+            guesses[:, traverser] = actions
+            self._play_seats(coins, guess_codes * self.num_actions + actions, guesses, later_seats)
+
+            action_utils = np.zeros((n, self.num_actions))
+            weight = self._terminal_utils(coins, guesses, traverser) / explore[np.arange(n), actions]
+            action_utils[np.arange(n), actions] = weight
+
+        infoset_utils = (strategy * action_utils).sum(axis=1, keepdims=True)
+        regrets = np.where(legal, action_utils - infoset_utils, 0.0) / n
+
+        np.add.at(store.cumulativeGain, rows, regrets)
+        return float(np.maximum(regrets, 0).sum())
+
+    def iteration(self):
+        # Returns the sampled estimate of the total positive gain, comparable to CFR.calc_gains
+        totGain = 0.0
+        for traverser in range(0, self.number_players):
+            totGain += self._traverse(traverser)
+
+        self.store.iterations += 1
+        return totGain
+
+    def policy(self) -> np.ndarray:
+        return self.average_strategy()
+
+    def checkpoint_state(self) -> dict:
+        state = super().checkpoint_state()
+        state['rng_state'] = json.dumps(self.rng.bit_generator.state)
+        return state
+
+    def load_checkpoint_state(self, checkpoint):
+        super().load_checkpoint_state(checkpoint)
+        self.rng.bit_generator.state = json.loads(str(checkpoint['rng_state']))
 
 class Player:
     def __init__(self, id, number_coins, number_players):
@@ -263,98 +893,384 @@ class Player:
             range(0, self.number_players * self.number_coins + 1), p=p
         )
 
-@lru_cache(maxsize=None)
-def get_coin_combinations(num_players, coin_sum, num_coins):
-    all_combinations = product(range(num_coins + 1), repeat=num_players)
-    valid_combinations = []
-    for comb in all_combinations:
-        if sum(comb) == coin_sum:
-            valid_combinations.append(comb)
-    
-    return valid_combinations
+@lru_cache(maxsize=COIN_SUM_CACHE_SIZE)
+def get_coin_sum_counts(num_players, num_coins) -> np.ndarray:
+    # counts[s] is the number of ways num_players seats holding 0..num_coins coins sum to s: the coefficients of
+    # (1 + x + ... + x^num_coins)^num_players. Read-only, the cached array is shared by every caller.
+    counts = np.ones(1, dtype=np.int64)
+    for _ in range(0, num_players):
+        counts = np.convolve(counts, np.ones(num_coins + 1, dtype=np.int64))
+    counts.setflags(write=False)
+    return counts
 
 
-def save_strategy(cfr : CFR, file_name : str):
+def strategy_file_name(number_coins, number_players) -> str:
+    # Path of the strategy without extension, the metrics, profile and checkpoint files are written next to it
+    return f'strategies/coin_game/coin_game_c{number_coins}p{number_players}'
 
-    strategy = {}
-    for historic in cfr.infoSets:
-        infoset = cfr.infoSets[historic]
-        actions = cfr.get_possible_actions(historic)
 
-        strategy[historic] = {action : infoset.actions[action].strategy for action in actions}
+def count_infosets(number_coins, number_players) -> int:
+    # (C + 1) * A! / (A - depth)! infosets per depth level, see CFR.init_info_sets
+    num_actions = number_players * number_coins + 1
+    return sum((number_coins + 1) * perm(num_actions, depth) for depth in range(0, number_players))
 
-    with open(f'{file_name}.json', 'w') as f:
-        json.dump(strategy, f)
 
+def save_strategy(cfr : CFR, file_name : str):
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "-nc", "--number_coins", type=int, default=1, help="Number of coins"
-    )
-    parser.add_argument(
-        "-p", "--number_players", type=int, default=3, help="Number of players"
-    )
+    strategy = {}
+    store = cfr.store
+    policy = cfr.policy()
+    for idx, historic in enumerate(store.historics):
+        actions = store.actions_of(idx)
 
-    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
-    args = vars(parser.parse_args(args=arglist))
+        strategy[cfr.historic_key(historic)] = {str(action) : float(policy[idx, action]) for action in actions}
 
-    cfr = CFR(args["number_coins"], args["number_players"])
+    with open(f'{file_name}.json', 'w') as f:
+        json.dump(strategy, f)
 
-    cfr.init_info_sets()
 
-    numIterations = 10_000_000_000
-    totGains = []
+def save_tree_strategy(solver : TreeCFR, file_name : str):
+    # The tree solver's infoset keys are the historic keys of CFR, so the file reads the same
+    with open(f'{file_name}.json', 'w') as f:
+        json.dump(solver.strategy_table(), f)
 
-    numGainsToPlot = 1_000_000
-    gainGrpSize = numIterations // numGainsToPlot
-    if gainGrpSize == 0:
-        gainGrpSize = 1
 
-    i = 0
-    while True:
+def checkpoint_solver(cfr : CFR) -> str:
+    # The --solver the checkpoint state belongs to, MCCFR keeps its regrets in the same store
+    return cfr.sampling if isinstance(cfr, MCCFR) else "cfr"
 
-        cfr.update_beliefs()
 
-        for infoSetStr in reversed(cfr.sorted_infoSets):
-            cfr.update_utilities_of_info_states(infoSetStr)
+def save_checkpoint(cfr : CFR, path : str, iteration : int):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            number_coins=cfr.number_coins,
+            number_players=cfr.number_players,
+            solver=checkpoint_solver(cfr),
+            variant=cfr.variant,
+            iteration=iteration,
+            **cfr.checkpoint_state(),
+        )
+        f.flush()
+        os.fsync(f.fileno())
 
-        cfr.calc_infoset_likelihoods()
+    # The rename is atomic, so a crash mid-write never leaves a truncated checkpoint behind
+    os.replace(tmp_path, path)
 
-        totGain = cfr.calc_gains()
 
-        if i % gainGrpSize == 0:
-            totGains.append(totGain)
-            print(f"It {i} -> TOT GAIN={totGain:.3f}")
+def load_checkpoint(cfr : CFR, path : str):
+    with np.load(path) as checkpoint:
+        config = (int(checkpoint['number_coins']), int(checkpoint['number_players']))
+        if config != (cfr.number_coins, cfr.number_players):
+            raise ValueError(f"Checkpoint {path} was written for (coins, players)={config}, "
+                             f"not {(cfr.number_coins, cfr.number_players)}")
 
-        cfr.update_strat()
+        # The gains of the variants do not mean the same thing, resuming under another update rule mixes them up.
+        # Checkpoints written before these fields existed are not checked.
+        if 'variant' in checkpoint:
+            config = (str(checkpoint['solver']), str(checkpoint['variant']))
+            if config != (checkpoint_solver(cfr), cfr.variant):
+                raise ValueError(f"Checkpoint {path} was written for (solver, variant)={config}, "
+                                 f"not {(checkpoint_solver(cfr), cfr.variant)}")
 
-        i += 1
-        if i >= numIterations or totGain <= 0.1:
-            break
+        cfr.load_checkpoint_state(checkpoint)
+        iteration = int(checkpoint['iteration'])
 
+    return iteration
 
-    save_strategy(cfr, f'strategies/coin_game/coin_game_c{args["number_coins"]}p{args["number_players"]}')
-    # InfoSetData.printInfoSetDataTable(infoSets)
 
-    # The if statement is just meant to make the script easier to run if you don't want to install matplotlib
-    if 'matplotlib' in sys.modules:
-        print(f'Plotting {len(totGains)} totGains')
-        # Generate random x, y coordinates
-        x = [x*gainGrpSize for x in range(len(totGains))]
-        y = totGains
+def main(argv: list[str] = None):
+    # argv defaults to the command line, sweep.py passes the arguments of every configuration it solves
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-nc", "--number_coins", type=int, default=1, help="Number of coins"
+    )
+    parser.add_argument(
+        "-p", "--number_players", type=int, default=3, help="Number of players"
+    )
+    parser.add_argument(
+        "--variant", choices=list(CFR_VARIANTS), default="vanilla", help="Update rule of the cfr and tree solvers"
+    )
+    parser.add_argument(
+        "--policy", choices=["current", "average"], default=None,
+        help="Strategy to save: the last one or the average (defaults to current for vanilla, average otherwise). "
+             "When the total gain rule stops the run, the current strategy it was checked on is saved"
+    )
+    parser.add_argument(
+        "--solver", choices=["cfr", "external", "outcome", "tree"], default="cfr",
+        help="Full-width CFR, Monte Carlo CFR with external / outcome sampling, or CFR on the compiled game tree"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1000, help="Games sampled per seat and iteration by the Monte Carlo solvers"
+    )
+    parser.add_argument(
+        "--epsilon", type=float, default=0.6, help="Exploration of the traverser in outcome sampling"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Random seed of the Monte Carlo solvers"
+    )
+    parser.add_argument(
+        "--max-iterations", type=int, default=10_000_000_000, help="Maximum number of iterations"
+    )
+    parser.add_argument(
+        "--incremental", type=float, default=None, metavar="EPSILON",
+        help="Only recompute the infosets whose inputs changed by more than EPSILON since they were last updated"
+    )
+    parser.add_argument(
+        "--full-sweep-every", type=int, default=100, help="Iterations between full recomputations with --incremental"
+    )
+    parser.add_argument(
+        "--prune", action="store_true",
+        help="Regret-based pruning: skip the infosets below guesses that provably keep zero probability (dcfr, linear)"
+    )
+    parser.add_argument(
+        "--prune-likelihood", type=float, default=None, metavar="THRESHOLD",
+        help="Skip the infosets whose gain weight (likelihood for vanilla, reach otherwise) is below THRESHOLD"
+    )
+    parser.add_argument(
+        "--prune-recheck", type=int, default=100, help="Iterations before an infoset skipped by --prune-likelihood is re-checked"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Worker processes sharing each depth level (1 runs serially)"
+    )
+    parser.add_argument(
+        "--stop-exploitability", type=float, default=None,
+        help="Stop once the exploitability (NashConv) of the strategy drops below this value instead of using the total gain"
+    )
+    parser.add_argument(
+        "--exploitability-every", type=int, default=1000, help="Iterations between exploitability evaluations"
+    )
+    parser.add_argument(
+        "--metrics-path", type=str, default=None, help="Convergence log (defaults to the strategy path + .metrics.csv)"
+    )
+    parser.add_argument(
+        "--no-plot", action="store_true", help="Headless run: do not plot the convergence log (matplotlib is never imported)"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Time every phase and track cache hits and peak memory (with --workers only whole iterations are timed)"
+    )
+    parser.add_argument(
+        "--profile-every", type=int, default=1000, help="Iterations between profile summaries"
+    )
+    parser.add_argument(
+        "--profile-output", type=str, default=None, help="Profile trace file (defaults to the strategy path + .profile.json)"
+    )
+    parser.add_argument(
+        "--init-strategy", type=str, default=None, metavar="PATH",
+        help="Warm start from a saved strategy (JSON or binary), infosets missing from it start uniform"
+    )
+    parser.add_argument(
+        "--checkpoint-every", type=int, default=0, help="Write a checkpoint every N iterations (0 disables it)"
+    )
+    parser.add_argument(
+        "--checkpoint-path", type=str, default=None, help="Checkpoint file (defaults to the strategy path + .ckpt.npz)"
+    )
+    parser.add_argument(
+        "--resume", type=str, default=None, help="Resume training from a checkpoint file"
+    )
 
-        # Create scatter plot
-        plt.scatter(x, y)
+    arglist = [x for x in (sys.argv[1:] if argv is None else argv) if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
 
-        # Set title and labels
-        plt.title('Total Gain per iteration')
-        plt.xlabel(f'Iteration # ')
-        plt.ylabel('Total Gain In Round')
+    # The total gain stopping rule is a property of the current strategy, it says nothing about the average one
+    if args["policy"] == "average" and args["stop_exploitability"] is None and args["solver"] in ("cfr", "tree"):
+        parser.error("--policy average needs --stop-exploitability, the total gain rule only checks the current strategy")
+
+    if args["prune"] and args["variant"] not in REGRET_PRUNING_VARIANTS:
+        parser.error(f"--prune needs negative cumulative gains, which only {' and '.join(REGRET_PRUNING_VARIANTS)} keep")
+
+    # Same default for the cfr and tree solvers: only vanilla writes its current strategy
+    average_policy = args["variant"] != "vanilla" if args["policy"] is None else args["policy"] == "average"
+
+    if args["solver"] == "cfr":
+        tracks_rows = args["incremental"] is not None or args["prune"] or args["prune_likelihood"] is not None
+        if tracks_rows and args["workers"] > 1:
+            parser.error("--incremental and pruning run in a single process, they cannot be combined with --workers")
+        cfr = CFR(args["number_coins"], args["number_players"], variant=args["variant"], average_policy=average_policy,
+                  dirty_epsilon=args["incremental"], full_sweep_every=args["full_sweep_every"],
+                  prune=args["prune"], prune_likelihood=args["prune_likelihood"], prune_recheck=args["prune_recheck"])
+    else:
+        if args["workers"] > 1:
+            parser.error("--workers is only supported by the full-width cfr solver")
+        if args["incremental"] is not None or args["prune"] or args["prune_likelihood"] is not None:
+            parser.error("--incremental and pruning are only supported by the full-width cfr solver")
+
+        if args["solver"] == "tree":
+            if args["checkpoint_every"] > 0 or args["resume"] is not None:
+                parser.error("checkpoints are not supported by the tree solver")
+            cfr = TreeCFR(compile_game(CoinGame(args["number_coins"], args["number_players"])), variant=args["variant"],
+                          average_policy=average_policy)
+        else:
+            # Monte Carlo CFR has a single update rule (regret matching on the sampled regrets) and outputs the average
+            if args["variant"] != "vanilla":
+                parser.error("--variant is only supported by the cfr and tree solvers")
+            if args["policy"] == "current":
+                parser.error("the Monte Carlo solvers always save the average strategy, --policy current is not supported")
+            cfr = MCCFR(args["number_coins"], args["number_players"], sampling=args["solver"],
+                        batch_size=args["batch_size"], epsilon=args["epsilon"], seed=args["seed"])
+
+    file_name = strategy_file_name(args["number_coins"], args["number_players"])
+
+    # Without --profile nothing is instrumented, the solver runs its plain methods
+    profiler = None
+    if args["profile"]:
+        profiler = Profiler()
+        if args["solver"] == "tree":
+            profiler.instrument(cfr, TREE_PHASES)
+        else:
+            profiler.instrument(cfr, CFR_PHASES if args["solver"] == "cfr" else MCCFR_PHASES)
+        profiler.watch_cache("get_coin_sum_counts", get_coin_sum_counts)
+
+    # The tree solver is ready once the game is compiled
+    if args["solver"] != "tree":
+        cfr.init_info_sets()
+    checkpoint_path = args["checkpoint_path"] or f'{file_name}.ckpt.npz'
+
+    metrics_path = args["metrics_path"] or f'{file_name}.metrics.csv'
+
+    numIterations = args["max_iterations"]
+
+    numGainsToPrint = 1_000_000
+    gainGrpSize = numIterations // numGainsToPrint
+    if gainGrpSize == 0:
+        gainGrpSize = 1
 
-        # Display the plot
-        plt.show()
+    # The best response tree is only built when exploitability is the stopping criterion (the tree solver
+    # computes it on its own tree)
+    br_tree = None
+    if args["stop_exploitability"] is not None and args["solver"] != "tree":
+        br_tree = BestResponseTree(cfr)
+
+    # Recorded in the metrics log, a warm started run only compares itself with a cold start of the same run_info
+    run_info = {"solver": args["solver"], "variant": args["variant"]}
+
+    # Iterations the run that wrote the initial strategy needed to meet the current stopping rule, read before this
+    # run's metrics log replaces it
+    cold_start = None
+    if args["init_strategy"] is not None:
+        if args["resume"] is not None:
+            parser.error("--init-strategy and --resume both set the starting point, use one of them")
+        seeded = cfr.load_initial_strategy(strategy_format.load_strategy(args["init_strategy"]))
+        num_infosets = len(cfr.store) if args["solver"] != "tree" else cfr.tree.num_infosets
+        missing = num_infosets - seeded
+        print(f"Warm start from {args['init_strategy']}: {seeded}/{num_infosets} infosets seeded"
+              + (f", {missing} missing from the file start uniform" if missing else ""))
+
+        # Only a cold start of the same solver and update rule is comparable, cold_start_missing says why there is
+        # nothing to compare with (printed when this run converges)
+        reference_log = f'{os.path.splitext(args["init_strategy"])[0]}.metrics.csv'
+        reference = read_metrics(reference_log) if os.path.exists(reference_log) else None
+        reference_run = read_run_info(reference_log) if reference is not None else None
+        if reference is None:
+            cold_start_missing = f"no cold start run logged next to {args['init_strategy']}"
+        elif "warm_start" in reference:
+            cold_start_missing = f"the run logged next to {args['init_strategy']} was warm started too"
+        elif reference_run != run_info:
+            recorded = ", ".join(f"{key} {value}" for key, value in reference_run.items()) or "no recorded solver and variant"
+            cold_start_missing = (f"the cold start run logged next to {args['init_strategy']} does not match this one "
+                                  f"({recorded}, not {', '.join(f'{key} {value}' for key, value in run_info.items())})")
+        else:
+            if args["stop_exploitability"] is not None:
+                cold_start = first_iteration_below(reference_log, "exploitability", args["stop_exploitability"])
+            elif args["solver"] in ("cfr", "tree"):
+                cold_start = first_iteration_below(reference_log, "tot_gain", 0.1)
+            last = max((iterations[-1] for iterations, _ in reference.values()), default=0)
+            cold_start_missing = (f"the cold start run logged next to {args['init_strategy']} stopped after {last} "
+                                  f"iterations without meeting this run's stopping rule")
 
+    i = 0
+    if args["resume"] is not None:
+        i = load_checkpoint(cfr, args["resume"])
+        print(f"Resumed from {args['resume']} at iteration {i}")
+
+    # Samples are indexed by the number of completed iterations, a resumed run drops the ones after its checkpoint
+    metrics = MetricsLog(metrics_path, resume_from=i if args["resume"] is not None else None, run_info=run_info)
+    if args["init_strategy"] is not None:
+        # Marks the log, a warm started run is no cold start reference for the next one
+        metrics.log(0, "warm_start", seeded, force=True)
+
+    # Both run the same phases on the same arrays, ParallelCFR just splits every depth level across processes
+    solver = ParallelCFR(cfr, args["workers"]) if args["workers"] > 1 else cfr
+
+    if profiler is not None:
+        profiler.instrument(solver, ["iteration"])
+        if args["stop_exploitability"] is not None:
+            profiler.instrument(cfr if br_tree is None else br_tree, ["exploitability"])
+
+    try:
+        while True:
+
+            totGain = solver.iteration()
+
+            if i % gainGrpSize == 0:
+                touched = "" if getattr(cfr, "touched", None) is None else \
+                    f" TOUCHED={cfr.touched['utilities']}/{len(cfr.store)} PRUNED={cfr.touched['pruned']}"
+                print(f"It {i} -> TOT GAIN={totGain:.3f}{touched}")
+
+            i += 1
+            metrics.log(i, "tot_gain", totGain)
+            if getattr(cfr, "touched", None) is not None:
+                metrics.log(i, "touched", cfr.touched["utilities"])
+                metrics.log(i, "pruned", cfr.touched["pruned"])
+            if profiler is not None and i % args["profile_every"] == 0:
+                profiler.snapshot(i)
+                print(f"It {i} -> PROFILE {profiler.summary()}")
+
+            if args["checkpoint_every"] > 0 and i % args["checkpoint_every"] == 0:
+                save_checkpoint(cfr, checkpoint_path, i)
+
+            # The sampled gain of the Monte Carlo solvers is too noisy to be a stopping rule
+            converged = totGain <= 0.1 and args["solver"] in ("cfr", "tree")
+            if args["stop_exploitability"] is not None:
+                converged = False
+                if i % args["exploitability_every"] == 0:
+                    if br_tree is None:
+                        exploitability = cfr.exploitability()
+                    else:
+                        exploitability = br_tree.exploitability(cfr.policy(), cfr.store.legal)
+                    print(f"It {i} -> EXPLOITABILITY={exploitability:.5f}")
+                    converged = exploitability <= args["stop_exploitability"]
+                    # The sample that met the stopping rule is always kept, it is what a warm started run compares to
+                    metrics.log(i, "exploitability", exploitability, force=converged)
+            elif converged:
+                metrics.log(i, "tot_gain", totGain, force=True)
+
+            if i >= numIterations or converged:
+                break
+    finally:
+        metrics.close()
+        if solver is not cfr:
+            solver.close()
+        if profiler is not None:
+            profiler.snapshot(i)
+            profile_path = args["profile_output"] or f'{file_name}.profile.json'
+            profiler.dump(profile_path)
+            print(f"Profile trace written to {profile_path}")
+
+    if args["init_strategy"] is not None:
+        if not converged:
+            print(f"Warm start: stopped after {i} iterations without meeting the stopping rule")
+        elif cold_start is None:
+            print(f"Warm start: converged after {i} iterations, {cold_start_missing}")
+        else:
+            print(f"Warm start: converged after {i} iterations, the cold start needed {cold_start} "
+                  f"({cold_start - i} iterations saved)")
+
+    # The total gain rule was met by the current strategy, the average one can still be far from it
+    current_met_rule = converged and args["stop_exploitability"] is None
+    if current_met_rule and cfr.average_policy:
+        print(f"Total gain rule met by the current strategy after {i} iterations, saving it instead of the average")
+        cfr.average_policy = False
+
+    if args["solver"] == "tree":
+        save_tree_strategy(cfr, file_name)
+    else:
+        save_strategy(cfr, file_name)
+
+    if not args["no_plot"]:
+        plot_metrics(metrics_path)
 
 
 if __name__ == "__main__":
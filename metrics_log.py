@@ -0,0 +1,174 @@
+import argparse
+import csv
+import math
+import os
+import sys
+import time
+
+
+# Streaming convergence log. Metrics are appended to a CSV file with one "iteration,metric,value" row per sample and
+# flushed every few seconds, so memory stays constant however long the run is and an interrupted run keeps its
+# history. Every iteration is kept up to `dense`, after that the samples are log-spaced (`per_decade` points per
+# factor of 10 in the iteration number), which bounds the file to a few thousand rows per decade. The schedule is kept
+# per metric, so a metric logged every k iterations (e.g. the exploitability) gets the same bound.
+#
+# run_info (e.g. the solver and variant) is written once as "0,run:<key>,<value>" rows at the top of a new log, so a
+# later run can tell whether the log is comparable with it (see read_run_info). read_metrics skips these rows.
+#
+# For a metric logged every iteration the schedule only depends on the iteration number, so a run resumed from a
+# checkpoint continues the same log.
+# Plots are rendered from the file by the command below, matplotlib is only imported there.
+#
+#   uv run metrics_log.py strategies/coin_game/coin_game_c1p3.metrics.csv -o convergence.png
+
+HEADER = ["iteration", "metric", "value"]
+RUN_INFO_PREFIX = "run:"
+
+
+class MetricsLog:
+    def __init__(self, path: str, dense: int = 1000, per_decade: int = 1000, flush_interval: float = 5.0,
+                 resume_from: int = None, run_info: dict[str, str] = None):
+        self.path = path
+        self.dense = dense
+        self.per_decade = per_decade
+        self.flush_interval = flush_interval
+        # Last iteration recorded for every metric
+        self.last_recorded: dict[str, int] = {}
+
+        if resume_from is not None and os.path.exists(path):
+            self._truncate(resume_from)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(HEADER)
+                writer.writerows([0, f"{RUN_INFO_PREFIX}{key}", value] for key, value in (run_info or {}).items())
+
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        self.last_flush = time.monotonic()
+
+    def _truncate(self, iteration: int):
+        # Samples written after the checkpoint are replayed by the resumed run, they are dropped first
+        with open(self.path, "r", newline="") as f:
+            rows = [row for row in csv.reader(f)][1:]
+        with open(self.path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            writer.writerows(row for row in rows if int(row[0]) <= iteration)
+
+    def _bucket(self, iteration: int) -> int:
+        return int(math.log10(iteration) * self.per_decade)
+
+    def should_record(self, iteration: int, metric: str = None) -> bool:
+        if iteration <= self.dense:
+            return True
+        # One sample per bucket, the first one logged in it
+        return self._bucket(iteration) != self._bucket(self.last_recorded.get(metric, iteration - 1))
+
+    def log(self, iteration: int, metric: str, value: float, force: bool = False):
+        # force bypasses the schedule, for one-off rows (e.g. the iteration that met the stopping rule). An iteration
+        # is never recorded twice for the same metric.
+        if self.last_recorded.get(metric) == iteration:
+            return
+        if not force and not self.should_record(iteration, metric):
+            return
+        self.last_recorded[metric] = iteration
+
+        self.writer.writerow([iteration, metric, repr(float(value))])
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_metrics(path: str) -> dict[str, tuple[list, list]]:
+    metrics = {}
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for iteration, metric, value in reader:
+            if metric.startswith(RUN_INFO_PREFIX):
+                continue
+            iterations, values = metrics.setdefault(metric, ([], []))
+            iterations.append(int(iteration))
+            values.append(float(value))
+    return metrics
+
+
+def read_run_info(path: str) -> dict[str, str]:
+    # The run_info the log was created with, empty for logs written before it was recorded
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return {metric[len(RUN_INFO_PREFIX):]: value for _, metric, value in reader if metric.startswith(RUN_INFO_PREFIX)}
+
+
+def first_iteration_below(path: str, metric: str, threshold: float) -> int:
+    # First logged iteration where `metric` is at or below `threshold`, None when it never is, when the log is
+    # missing or when it comes from a warm started run (see main.py --init-strategy)
+    try:
+        metrics = read_metrics(path)
+    except OSError:
+        return None
+    if "warm_start" in metrics:
+        return None
+
+    for iteration, value in zip(*metrics.get(metric, ([], []))):
+        if value <= threshold:
+            return iteration
+    return None
+
+
+def plot_metrics(path: str, output: str = None, log_x: bool = False):
+    # Imported here so training never needs matplotlib (or a display)
+    import matplotlib
+    if output is not None:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    metrics = read_metrics(path)
+    if not metrics:
+        print(f"No metrics in {path}")
+        return
+
+    fig, axes = plt.subplots(len(metrics), 1, sharex=True, squeeze=False, figsize=(8, 3 * len(metrics)))
+    for ax, (metric, (iterations, values)) in zip(axes[:, 0], metrics.items()):
+        print(f'Plotting {len(values)} {metric}')
+        ax.scatter(iterations, values, s=4)
+        ax.set_ylabel(metric)
+        if log_x:
+            ax.set_xscale("log")
+
+    axes[0, 0].set_title(os.path.basename(path))
+    axes[-1, 0].set_xlabel('Iteration # ')
+
+    if output is not None:
+        fig.savefig(output)
+        print(f"Plot written to {output}")
+    else:
+        plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot a metrics log written during training")
+    parser.add_argument("path", type=str, help="Metrics file, e.g. strategies/coin_game/coin_game_c1p3.metrics.csv")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Save the plot to this file instead of showing it")
+    parser.add_argument("--log-x", action="store_true", help="Logarithmic iteration axis")
+
+    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
+
+    plot_metrics(args["path"], output=args["output"], log_x=args["log_x"])
+
+
+if __name__ == "__main__":
+    main()
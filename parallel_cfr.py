@@ -0,0 +1,139 @@
+import multiprocessing as mp
+from threading import BrokenBarrierError
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+# Level-parallel execution of CFR.iteration(). The per-infoset arrays of the InfoSetStore are moved into shared
+# memory, every worker process builds its own copy of the (read-only) precomputed tables and attaches to those
+# arrays, and each depth level is split into one contiguous block of rows per worker. Workers meet at a barrier
+# after every level, and every phase only writes the rows it owns, so the result is identical to serial mode.
+
+SHARED_ARRAYS = (
+    "strategy", "cumulativeGain", "strategySum", "util", "beliefs", "expectedUtil", "likelihood", "reach", "gain",
+    "iterations",
+)
+
+
+def _split_level(level: slice, num_workers: int) -> list[slice]:
+    bounds = np.linspace(level.start, level.stop, num_workers + 1).astype(int)
+    return [slice(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _worker(cfr_class, number_coins, number_players, variant, specs, worker_id, num_workers,
+            start_barrier, level_barrier, done_barrier, stop):
+    shms = []
+    try:
+        cfr = cfr_class(number_coins, number_players, variant=variant)
+        cfr.init_info_sets()
+
+        for name, (shm_name, shape, dtype) in specs.items():
+            shm = SharedMemory(name=shm_name)
+            shms.append(shm)
+            setattr(cfr.store, name, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+        my_rows = [_split_level(level, num_workers)[worker_id] for level in cfr.level_slices]
+        my_belief_levels = []
+        for level, belief_level, rows in zip(cfr.level_slices, cfr.belief_levels, my_rows):
+            start, end = rows.start - level.start, rows.stop - level.start
+            my_belief_levels.append(tuple(table[start:end] for table in belief_level))
+
+        done_barrier.wait()
+
+        while True:
+            start_barrier.wait()
+            if stop.is_set():
+                break
+
+            for rows, belief_level in zip(my_rows, my_belief_levels):
+                cfr.update_level_beliefs(belief_level)
+                cfr._update_utilities(rows)
+                level_barrier.wait()
+
+            # Likelihoods flow from one depth to the next, the barrier makes the previous level visible
+            for rows in my_rows:
+                cfr.calc_infoset_likelihoods(rows)
+                level_barrier.wait()
+
+            for rows in my_rows:
+                cfr.calc_gains(rows)
+                cfr.update_strat(rows)
+
+            done_barrier.wait()
+    except BaseException:
+        # Wake everybody up instead of leaving the other processes stuck at a barrier
+        for barrier in (start_barrier, level_barrier, done_barrier):
+            barrier.abort()
+        raise
+    finally:
+        for shm in shms:
+            shm.close()
+
+
+class ParallelCFR:
+    def __init__(self, cfr, num_workers: int):
+        self.cfr = cfr
+        self.num_workers = num_workers
+
+        self.shms = []
+        specs = {}
+        for name in SHARED_ARRAYS:
+            array = getattr(cfr.store, name)
+            shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+            shared[...] = array
+            setattr(cfr.store, name, shared)
+            self.shms.append(shm)
+            specs[name] = (shm.name, array.shape, array.dtype.str)
+
+        ctx = mp.get_context("spawn")
+        self.start_barrier = ctx.Barrier(num_workers + 1)
+        self.done_barrier = ctx.Barrier(num_workers + 1)
+        self.level_barrier = ctx.Barrier(num_workers)
+        self.stop = ctx.Event()
+
+        self.processes = [
+            ctx.Process(
+                target=_worker,
+                args=(type(cfr), cfr.number_coins, cfr.number_players, cfr.variant, specs, worker_id, num_workers,
+                      self.start_barrier, self.level_barrier, self.done_barrier, self.stop),
+                daemon=True,
+            )
+            for worker_id in range(num_workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+        # Wait until every worker has built its tables and attached to the shared arrays
+        self.done_barrier.wait()
+
+    def iteration(self):
+        self.start_barrier.wait()
+        self.done_barrier.wait()
+
+        # Workers are idle until the next start, so the coordinator owns the iteration counter
+        self.cfr.store.iterations += 1
+        return float(self.cfr.store.gain.sum())
+
+    def close(self):
+        self.stop.set()
+        try:
+            self.start_barrier.wait()
+        except BrokenBarrierError:
+            # A worker failed (or was interrupted) and aborted the barriers, the others are exiting too
+            pass
+        for process in self.processes:
+            process.join()
+
+        # Hand the arrays back to the store as private copies before releasing the shared segments
+        for name, shm in zip(SHARED_ARRAYS, self.shms):
+            setattr(self.cfr.store, name, getattr(self.cfr.store, name).copy())
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
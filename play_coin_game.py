@@ -1,12 +1,14 @@
 import argparse
-import json
 import sys
 import random
 
+from historic_codec import encode_historic
+import strategy_format
+from strategy_server import StrategyClient
+
 def load_strategy(filename):
-    with open(f"{filename}.json", 'r') as file:
-        strategy = json.load(file)
-    return strategy
+    # Prefer the memory-mapped binary strategy when one has been generated from the current JSON file
+    return strategy_format.load_strategy(strategy_format.strategy_file(filename))
 
 def main():
     parser = argparse.ArgumentParser()
@@ -19,17 +21,28 @@ def main():
     parser.add_argument(
         "-ng", "--number_games", type=int, default=1, help="Number of games"
     )
+    parser.add_argument(
+        "--server", type=str, default=None,
+        help="Ask a running strategy_server.py (Unix socket path or host:port) instead of loading the strategy"
+    )
 
     arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
     args = vars(parser.parse_args(args=arglist))
 
-    strategy = load_strategy(f'strategies/coin_game/coin_game_c{args["number_coins"]}p{args["number_players"]}')
+    strategy_name = f'coin_game_c{args["number_coins"]}p{args["number_players"]}'
+    client = None
+    if args["server"] is None:
+        strategy = load_strategy(f'strategies/coin_game/{strategy_name}')
+    else:
+        client = StrategyClient(args["server"])
 
     num_p = args["number_players"]
     num_c = args["number_coins"]
 
+    num_actions = num_p * num_c + 1
+
     for i in range(0, args["number_games"]):
-        historic = ''
+        guesses = ()
         human_player_idx = i % args["number_players"]
 
         while True:
@@ -38,32 +51,48 @@ def main():
                 break
             print("Input a valid number!")
 
-        historic += player_coin
         bot_coins = [random.randint(0, num_c) for _ in range(0, num_p - 1)]
         bot_count = 0
         
         for j in range(0, num_p):
             if j == human_player_idx:
-                human_guess = input(f"The historic is: {historic}\nWhat is your guess: ")
-                historic += human_guess
+                historic = encode_historic((int(player_coin),) + guesses, num_actions)
+                # The strategy file lists exactly the legal guesses of every infoset
+                if client is None:
+                    legal_guesses = strategy[historic].keys()
+                else:
+                    legal_guesses = client.distribution(strategy_name, historic).keys()
+                while True:
+                    human_guess = input(f"The historic is: {historic}\nWhat is your guess: ")
+                    if human_guess in legal_guesses:
+                        break
+                    print(f"Input a valid guess ({', '.join(legal_guesses)})!")
+                guesses += (int(human_guess),)
             else:
                 bot_coin = bot_coins[bot_count]
-                bot_historic = str(bot_coin) + historic[1:]
+                bot_historic = encode_historic((bot_coin,) + guesses, num_actions)
 
-                bot_strategy = strategy[bot_historic]
-                bot_guesses = [guess for guess in bot_strategy]
-                bot_probs = [bot_strategy[guess] for guess in bot_strategy]
-                bot_guess = random.choices(bot_guesses, weights=bot_probs)[0]
-                historic += bot_guess
+                if client is None:
+                    bot_strategy = strategy[bot_historic]
+                    bot_guesses = [guess for guess in bot_strategy]
+                    bot_probs = [bot_strategy[guess] for guess in bot_strategy]
+                    bot_guess = random.choices(bot_guesses, weights=bot_probs)[0]
+                else:
+                    bot_guess = client.sample(strategy_name, bot_historic)
+                guesses += (int(bot_guess),)
                 bot_count += 1
 
         sum_coins = int(player_coin) + sum(bot_coins)
+        historic = encode_historic((int(player_coin),) + guesses, num_actions)
         print(f"Sum of coins: {sum_coins} - historic: {historic}")
         if sum_coins == int(human_guess):
             print(f"Human player wins")
         else:
             print(f"Human player loses")
 
+    if client is not None:
+        client.close()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
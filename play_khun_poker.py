@@ -1,6 +1,7 @@
-import json
 import random
 
+import strategy_format
+
 CARD_MAP = ["J", "Q", "K"]
 TERMINAL_ACTION_STR_MAP = {"pp", "bb", "bp", "pbb", "pbp"}
 
@@ -33,9 +34,8 @@ def calcUtilityAtTerminalNode(pocket1, pocket2, actionStr: str):
 
 
 def load_strategy(filename):
-    with open(filename, 'r') as file:
-        strategy = json.load(file)
-    return strategy
+    # Accepts both JSON and binary strategy files, the format is detected from the file contents
+    return strategy_format.load_strategy(filename)
 
 def get_computer_action(strategy, history):
     if history in strategy.keys():
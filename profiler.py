@@ -0,0 +1,150 @@
+import json
+import sys
+import time
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, the peak memory is then not reported
+    resource = None
+
+
+# Opt-in profiling of the training loop. Profiler.instrument() shadows methods of an object with instance
+# attributes that time and count every call, so nothing is added to the code paths of a run without --profile.
+# Phases that call each other (e.g. iteration -> update_beliefs) are timed independently, their totals overlap.
+
+CFR_PHASES = (
+    "init_info_sets", "update_beliefs", "update_utilities", "calc_infoset_likelihoods", "calc_gains", "update_strat",
+    "update_dirty_beliefs", "_update_utilities", "update_dirty_likelihoods", "update_pruning",
+)
+MCCFR_PHASES = ("init_info_sets", "_traverse")
+TREE_PHASES = ("forward", "backward", "update")
+
+
+def peak_memory() -> int:
+    # Peak resident set size of the process in bytes, None where it cannot be measured
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PhaseStats:
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls, "total": self.total, "max": self.max,
+            "mean": self.total / self.calls if self.calls else 0.0,
+        }
+
+
+class Profiler:
+    def __init__(self):
+        self.phases: dict[str, PhaseStats] = {}
+        self.counters: dict[str, int] = {}
+        self.caches: dict = {}
+        self.cache_start: dict = {}
+        self.snapshots = []
+        self.start = time.perf_counter()
+
+    def _stats(self, name: str) -> PhaseStats:
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats()
+        return stats
+
+    def timed(self, func, name: str):
+        stats = self._stats(name)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.add(time.perf_counter() - start)
+
+        return wrapper
+
+    def counted(self, func, name: str):
+        self.counters.setdefault(name, 0)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            self.counters[name] += 1
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    def instrument(self, obj, phases=(), counted=()):
+        for name in phases:
+            setattr(obj, name, self.timed(getattr(obj, name), name))
+        for name in counted:
+            setattr(obj, name, self.counted(getattr(obj, name), name))
+
+    def watch_cache(self, name: str, cached_func):
+        # lru_cache statistics are process wide, only the hits and misses after this call are reported
+        self.caches[name] = cached_func
+        self.cache_start[name] = cached_func.cache_info()
+
+    def cache_stats(self) -> dict:
+        stats = {}
+        for name, cached_func in self.caches.items():
+            info, start = cached_func.cache_info(), self.cache_start[name]
+            stats[name] = {
+                "hits": info.hits - start.hits, "misses": info.misses - start.misses,
+                "size": info.currsize, "maxsize": info.maxsize,
+            }
+        return stats
+
+    def summary(self) -> str:
+        # Single line, e.g. "update_beliefs=86.9ms/3000 (35%) ...": total time / calls and share of the wall time
+        wall = time.perf_counter() - self.start
+        parts = [
+            f"{name}={stats.total * 1e3:.1f}ms/{stats.calls} ({stats.total / wall:.0%})"
+            for name, stats in self.phases.items() if stats.calls
+        ]
+        parts += [f"{name}={count}" for name, count in self.counters.items()]
+        parts += [
+            f"{name}={stats['hits']}/{stats['misses']} hits/misses ({stats['size']}/{stats['maxsize']} entries)"
+            for name, stats in self.cache_stats().items()
+        ]
+        memory = peak_memory()
+        if memory is not None:
+            parts.append(f"peak={memory / 2**20:.1f}MiB")
+        return " ".join(parts)
+
+    def snapshot(self, iteration: int):
+        self.snapshots.append({
+            "iteration": iteration,
+            "wall": time.perf_counter() - self.start,
+            "phases": {name: stats.total for name, stats in self.phases.items()},
+            "peak_memory": peak_memory(),
+        })
+
+    def trace(self) -> dict:
+        return {
+            "wall": time.perf_counter() - self.start,
+            "phases": {name: stats.to_dict() for name, stats in self.phases.items()},
+            "counters": dict(self.counters),
+            "caches": self.cache_stats(),
+            "peak_memory": peak_memory(),
+            "snapshots": self.snapshots,
+        }
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.trace(), f, indent=2)
+
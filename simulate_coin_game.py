@@ -0,0 +1,161 @@
+import argparse
+import sys
+import time
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from historic_codec import decode_historic, pack_historic, pack_historic_codes
+from play_coin_game import load_strategy
+
+
+# Headless bot-only self-play. Games are simulated in batches: coins for every seat are drawn at once and
+# each seat then samples its guess for all games of the batch with a vectorized inverse-CDF over the
+# strategy rows of the infosets it is in.
+
+class StrategyTable:
+    # Dense copy of a strategy file. Rows are sorted by packed historic code (see historic_codec.py), so a batch
+    # of infosets is found with one np.searchsorted.
+    def __init__(self, strategy: Mapping, number_coins: int, number_players: int):
+        self.number_coins = number_coins
+        self.number_players = number_players
+        self.num_actions = number_players * number_coins + 1
+
+        keys = list(strategy)
+        codes = np.zeros(len(keys), dtype=np.int64)
+        probs = np.zeros((len(keys), self.num_actions))
+        for row, key in enumerate(keys):
+            codes[row] = pack_historic(decode_historic(key, self.num_actions), self.num_actions)
+            for action, prob in strategy[key].items():
+                probs[row, int(action)] = prob
+
+        order = np.argsort(codes)
+        self.codes = codes[order]
+        self.probs = probs[order]
+
+    def rows_of(self, coins: np.ndarray, guess_codes: np.ndarray, depth: int) -> np.ndarray:
+        codes = pack_historic_codes(coins, guess_codes, depth, self.num_actions)
+        rows = np.searchsorted(self.codes, codes)
+        rows = np.minimum(rows, len(self.codes) - 1)
+        if not np.array_equal(self.codes[rows], codes):
+            raise KeyError(f"Strategy has no entry for some infosets at depth {depth}")
+        return rows
+
+
+def simulate_games(table: StrategyTable, num_games: int, rng: np.random.Generator, batch_size: int = 100_000):
+    # Returns the number of wins of every seat and the number of games nobody won
+    num_p, num_c = table.number_players, table.number_coins
+    wins = np.zeros(num_p, dtype=np.int64)
+    no_winner = 0
+
+    for start in range(0, num_games, batch_size):
+        n = min(batch_size, num_games - start)
+
+        coins = rng.integers(0, num_c + 1, size=(n, num_p))
+        sum_coins = coins.sum(axis=1)
+
+        available = np.ones((n, table.num_actions), dtype=bool)
+        guess_codes = np.zeros(n, dtype=np.int64)
+        guesses = np.zeros((n, num_p), dtype=np.int64)
+
+        for seat in range(0, num_p):
+            rows = table.rows_of(coins[:, seat], guess_codes, seat)
+
+            # Guesses already taken are masked out, whatever the strategy file says about them
+            probs = table.probs[rows] * available
+            cdf = np.cumsum(probs, axis=1)
+            u = rng.random(n) * cdf[:, -1]
+            guess = (cdf <= u[:, None]).sum(axis=1)
+
+            guesses[:, seat] = guess
+            available[np.arange(n), guess] = False
+            guess_codes = guess_codes * table.num_actions + guess
+
+        winners = guesses == sum_coins[:, None]
+        wins += winners.sum(axis=0)
+        no_winner += int((~winners.any(axis=1)).sum())
+
+    return wins, no_winner
+
+
+def _simulate_chunk(strategy_file, number_coins, number_players, num_games, seed_seq, batch_size):
+    table = StrategyTable(load_strategy(strategy_file), number_coins, number_players)
+    return simulate_games(table, num_games, np.random.default_rng(seed_seq), batch_size)
+
+
+def run_simulation(strategy_file: str, number_coins: int, number_players: int, num_games: int,
+                   seed: int = None, workers: int = 1, batch_size: int = 100_000):
+    seed_seq = np.random.SeedSequence(seed)
+
+    if workers <= 1:
+        return _simulate_chunk(strategy_file, number_coins, number_players, num_games, seed_seq, batch_size)
+
+    # Every worker gets an independent child seed, so results only depend on (seed, workers)
+    chunk_sizes = [num_games // workers + (1 if i < num_games % workers else 0) for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_simulate_chunk, strategy_file, number_coins, number_players, size, child, batch_size)
+            for size, child in zip(chunk_sizes, seed_seq.spawn(workers))
+        ]
+        results = [future.result() for future in futures]
+
+    wins = sum(result[0] for result in results)
+    no_winner = sum(result[1] for result in results)
+    return wins, no_winner
+
+
+def wilson_interval(successes: int, trials: int, z: float = 1.96):
+    if trials == 0:
+        return 0.0, 0.0
+    p = successes / trials
+    denominator = 1 + z ** 2 / trials
+    center = (p + z ** 2 / (2 * trials)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+    return center - half_width, center + half_width
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-nc", "--number_coins", type=int, default=1, help="Number of coins"
+    )
+    parser.add_argument(
+        "-p", "--number_players", type=int, default=3, help="Number of players"
+    )
+    parser.add_argument(
+        "-ng", "--number_games", type=int, default=1_000_000, help="Number of games"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Random seed"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100_000, help="Games simulated at once by each worker"
+    )
+
+    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
+
+    strategy_file = f'strategies/coin_game/coin_game_c{args["number_coins"]}p{args["number_players"]}'
+    num_games = args["number_games"]
+
+    start = time.perf_counter()
+    wins, no_winner = run_simulation(
+        strategy_file, args["number_coins"], args["number_players"], num_games,
+        seed=args["seed"], workers=args["workers"], batch_size=args["batch_size"],
+    )
+    elapsed = time.perf_counter() - start
+
+    print(f"Simulated {num_games} games in {elapsed:.2f}s ({num_games / elapsed:,.0f} games/s)")
+    for seat, seat_wins in enumerate(wins):
+        low, high = wilson_interval(int(seat_wins), num_games)
+        print(f"Seat {seat}: win rate {seat_wins / num_games:.4f} (95% CI {low:.4f} - {high:.4f})")
+    low, high = wilson_interval(no_winner, num_games)
+    print(f"No winner: {no_winner / num_games:.4f} (95% CI {low:.4f} - {high:.4f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+# Binary strategy files hold the same {infoset: {action: probability}} table as the JSON files, laid out so it can
+# be memory-mapped and queried without parsing the whole file:
+#
+#   magic | header | key_offsets u32[n+1] | entry_offsets u32[n+1] | entry_labels u16[m] | pad | entry_probs f64[m]
+#         | label_offsets u32[l+1] | label_blob | key_blob
+#
+# Infoset keys are sorted (as utf-8 bytes), so a lookup is a binary search over the key column, and the actions of
+# infoset i are entries entry_offsets[i]:entry_offsets[i+1]. Action labels ("0", "12", "b", ...) are interned in a
+# small label table.
+
+MAGIC = b"CGSTRAT1"
+HEADER = struct.Struct("<5I")
+BINARY_EXTENSION = ".strat"
+
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def write_binary_strategy(strategy: dict, path: str):
+    keys = sorted(strategy.keys(), key=lambda key: key.encode())
+
+    labels = sorted({action for actions in strategy.values() for action in actions})
+    label_ids = {label: i for i, label in enumerate(labels)}
+
+    key_bytes = [key.encode() for key in keys]
+    label_bytes = [label.encode() for label in labels]
+
+    entry_offsets = np.zeros(len(keys) + 1, dtype="<u4")
+    entry_labels, entry_probs = [], []
+    for i, key in enumerate(keys):
+        for action, prob in strategy[key].items():
+            entry_labels.append(label_ids[action])
+            entry_probs.append(prob)
+        entry_offsets[i + 1] = len(entry_labels)
+
+    key_offsets = np.concatenate(([0], np.cumsum([len(k) for k in key_bytes]))).astype("<u4")
+    label_offsets = np.concatenate(([0], np.cumsum([len(l) for l in label_bytes]))).astype("<u4")
+    entry_labels = np.asarray(entry_labels, dtype="<u2")
+    entry_probs = np.asarray(entry_probs, dtype="<f8")
+
+    key_blob = b"".join(key_bytes)
+    label_blob = b"".join(label_bytes)
+
+    header = HEADER.pack(len(keys), len(entry_labels), len(labels), len(key_blob), len(label_blob))
+    body = [MAGIC, header, key_offsets.tobytes(), entry_offsets.tobytes(), entry_labels.tobytes()]
+    size = sum(len(part) for part in body)
+    body.append(b"\0" * (_align(size) - size))
+    body += [entry_probs.tobytes(), label_offsets.tobytes(), label_blob, key_blob]
+
+    with open(path, "wb") as f:
+        f.write(b"".join(body))
+
+
+class _KeyColumn(Sequence):
+    # Sorted infoset keys as seen by bisect, decoded lazily from the mapped key blob
+    def __init__(self, buffer, offsets: np.ndarray, start: int):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.start = start
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.buffer[self.start + self.offsets[i]:self.start + self.offsets[i + 1]]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+class BinaryStrategy(Mapping):
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a binary strategy file")
+
+        num_infosets, num_entries, num_labels, key_blob_len, label_blob_len = HEADER.unpack_from(self.buffer, len(MAGIC))
+
+        offset = len(MAGIC) + HEADER.size
+        self.key_offsets = np.frombuffer(self.buffer, dtype="<u4", count=num_infosets + 1, offset=offset)
+        offset += self.key_offsets.nbytes
+        self.entry_offsets = np.frombuffer(self.buffer, dtype="<u4", count=num_infosets + 1, offset=offset)
+        offset += self.entry_offsets.nbytes
+        self.entry_labels = np.frombuffer(self.buffer, dtype="<u2", count=num_entries, offset=offset)
+        offset = _align(offset + self.entry_labels.nbytes)
+        self.entry_probs = np.frombuffer(self.buffer, dtype="<f8", count=num_entries, offset=offset)
+        offset += self.entry_probs.nbytes
+        label_offsets = np.frombuffer(self.buffer, dtype="<u4", count=num_labels + 1, offset=offset)
+        offset += label_offsets.nbytes
+
+        # The label table is tiny (one entry per distinct action), so it is decoded up front
+        self.labels = [
+            self.buffer[offset + label_offsets[i]:offset + label_offsets[i + 1]].decode() for i in range(num_labels)
+        ]
+        offset += label_blob_len
+
+        self.keys_column = _KeyColumn(self.buffer, self.key_offsets, offset)
+
+    def find(self, key: str) -> int:
+        key_bytes = key.encode()
+        i = bisect.bisect_left(self.keys_column, key_bytes)
+        if i == len(self.keys_column) or self.keys_column[i] != key_bytes:
+            raise KeyError(key)
+        return i
+
+    def actions_of(self, key: str):
+        # Returns the action labels and a (zero-copy) view of their probabilities
+        i = self.find(key)
+        start, end = self.entry_offsets[i], self.entry_offsets[i + 1]
+        return [self.labels[label] for label in self.entry_labels[start:end]], self.entry_probs[start:end]
+
+    def __getitem__(self, key: str) -> dict[str, float]:
+        labels, probs = self.actions_of(key)
+        return dict(zip(labels, probs.tolist()))
+
+    def __iter__(self):
+        return (key.decode() for key in self.keys_column)
+
+    def __len__(self):
+        return len(self.keys_column)
+
+    def close(self):
+        # Drop the numpy views first, mmap refuses to close while buffers are exported
+        self.key_offsets = self.entry_offsets = self.entry_labels = self.entry_probs = None
+        self.keys_column = None
+        self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_binary_strategy(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_strategy(path: str) -> Mapping:
+    if is_binary_strategy(path):
+        return BinaryStrategy(path)
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def strategy_file(base_path: str) -> str:
+    # The binary strategy next to base_path.json when it is at least as recent as the JSON file, which main.py and
+    # sweep.py rewrite on every solve without touching the binary one
+    json_path = f"{base_path}.json"
+    binary_path = f"{base_path}{BINARY_EXTENSION}"
+    if os.path.exists(binary_path) and (not os.path.exists(json_path)
+                                        or os.path.getmtime(binary_path) >= os.path.getmtime(json_path)):
+        return binary_path
+    return json_path
+
+
+def convert_json_to_binary(json_path: str, binary_path: str = None) -> str:
+    if binary_path is None:
+        binary_path = json_path.removesuffix(".json") + BINARY_EXTENSION
+
+    with open(json_path, "r") as f:
+        write_binary_strategy(json.load(f), binary_path)
+
+    return binary_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSON strategy files into the memory-mapped binary format")
+    parser.add_argument("files", nargs="+", help="JSON strategy files, e.g. strategies/coin_game/*.json")
+
+    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
+
+    for json_path in args["files"]:
+        binary_path = convert_json_to_binary(json_path)
+        print(f"{json_path} -> {binary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import re
+import socket
+import sys
+import time
+from collections.abc import Mapping
+
+import numpy as np
+
+import strategy_format
+
+
+# Local strategy-serving daemon. Every coin game strategy in strategies/coin_game/ and the Kuhn poker strategy.json
+# are loaded once into dense arrays, and clients ask over a Unix socket or localhost TCP for a sampled action or the
+# distribution of an infoset. The protocol is one JSON object per line in both directions, requests carry an "id"
+# echoed by the response so a connection can pipeline them:
+#
+#   {"id": 1, "op": "sample", "strategy": "coin_game_c1p3", "infoset": "02"}   ->  {"id": 1, "action": "1"}
+#   {"id": 2, "op": "distribution", "strategy": "khun_poker", "infoset": "Kb"} ->  {"id": 2, "distribution": {...}}
+#
+# Infosets use the keys of the strategy files (see historic_codec.py): the coins held then the guesses so far, e.g. "02"
+# for no coin after a guess of 2, separated by dots ("0.2") once P * C >= 10.
+#
+# Sample requests are micro-batched: the requests that are waiting once the batcher gets to run, plus those arriving
+# within --max-delay (0 by default, the batcher only yields to the event loop once), are sampled together (up to
+# --max-batch) with one vectorized inverse-CDF per strategy.
+#
+#   uv run strategy_server.py serve --address /tmp/coin_game.sock
+#   uv run play_coin_game.py -nc 1 -p 3 --server /tmp/coin_game.sock
+#   uv run strategy_server.py bench --address /tmp/coin_game.sock --strategy coin_game_c1p3 --connections 50
+
+KHUN_POKER = "khun_poker"
+
+
+def parse_address(address: str) -> tuple:
+    # "host:port" for TCP, anything else is the path of a Unix socket
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return None, host, int(port)
+    return address, None, None
+
+
+def strategy_path(name: str) -> str:
+    # Same files as the play scripts, with the binary version of a coin game strategy preferred when it is up to date
+    if name == KHUN_POKER:
+        return "strategy.json"
+    return strategy_format.strategy_file(f"strategies/coin_game/{name}")
+
+
+def available_strategies() -> list[str]:
+    # Only the strategies themselves, not the other JSON files written next to them (e.g. .sweep.json)
+    names = sorted(
+        name for name in (os.path.basename(path)[:-len(".json")] for path in glob.glob("strategies/coin_game/*.json"))
+        if re.fullmatch(r"coin_game_c\d+p\d+", name)
+    )
+    if os.path.exists(strategy_path(KHUN_POKER)):
+        names.append(KHUN_POKER)
+    return names
+
+
+class DenseStrategy:
+    # One strategy file as arrays: a row per infoset, a column per action label, and the cumulative distribution of
+    # every row for sampling
+    def __init__(self, strategy: Mapping):
+        self.index: dict[str, int] = {}
+        self.labels: list[str] = []
+        label_ids: dict[str, int] = {}
+        entries = []
+        for key in strategy:
+            self.index[key] = len(entries)
+            actions = strategy[key]
+            for label in actions:
+                if label not in label_ids:
+                    label_ids[label] = len(self.labels)
+                    self.labels.append(label)
+            entries.append([(label_ids[label], prob) for label, prob in actions.items()])
+
+        self.probs = np.zeros((len(entries), len(self.labels)))
+        # Illegal actions are absent from the files, they are masked out of the distributions returned
+        self.present = np.zeros((len(entries), len(self.labels)), dtype=bool)
+        for row, actions in enumerate(entries):
+            for label_id, prob in actions:
+                self.probs[row, label_id] = prob
+                self.present[row, label_id] = True
+
+        self.cdf = np.cumsum(self.probs, axis=1)
+        total = self.cdf[:, -1:]
+        self.cdf /= np.where(total > 0, total, 1)
+
+    def distribution(self, key: str) -> dict[str, float]:
+        row = self.index[key]
+        return {self.labels[i]: float(self.probs[row, i]) for i in np.flatnonzero(self.present[row])}
+
+    def sample(self, rows: np.ndarray, u: np.ndarray) -> np.ndarray:
+        # Label ids for uniform draws u in [0, 1)
+        return np.minimum((self.cdf[rows] <= u[:, None]).sum(axis=1), len(self.labels) - 1)
+
+
+async def start_listener(handler, address: str) -> asyncio.AbstractServer:
+    path, host, port = parse_address(address)
+    if path is not None:
+        # Left behind by a previous run that was killed
+        if os.path.exists(path):
+            os.remove(path)
+        return await asyncio.start_unix_server(handler, path)
+    return await asyncio.start_server(handler, host, port)
+
+
+class StrategyServer:
+    def __init__(self, strategies: dict[str, DenseStrategy], max_batch: int = 1024, max_delay: float = 0.0,
+                 seed: int = None):
+        self.strategies = strategies
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.rng = np.random.default_rng(seed)
+        self.queue: asyncio.Queue = None
+        self.stats = {"requests": 0, "samples": 0, "batches": 0}
+
+    def start(self) -> asyncio.Task:
+        # Starts the batcher in the running event loop, serve() does it for the daemon and in-process users (e.g.
+        # table_runner.py) call it directly
+        self.queue = asyncio.Queue()
+        return asyncio.create_task(self._batch_loop())
+
+    async def sample(self, name: str, key: str) -> str:
+        table = self.strategies[name]
+        row = table.index[key]
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((table, row, future))
+        return await future
+
+    async def _batch_loop(self):
+        while True:
+            batch = [await self.queue.get()]
+            # Lets the requests already on their way join the batch
+            await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            u = self.rng.random(len(batch))
+            by_table: dict[int, list[int]] = {}
+            for i, (table, _, _) in enumerate(batch):
+                by_table.setdefault(id(table), []).append(i)
+
+            for positions in by_table.values():
+                table = batch[positions[0]][0]
+                rows = np.array([batch[i][1] for i in positions], dtype=np.intp)
+                label_ids = table.sample(rows, u[positions])
+                for i, label_id in zip(positions, label_ids):
+                    future = batch[i][2]
+                    if not future.done():
+                        future.set_result(table.labels[label_id])
+
+            self.stats["samples"] += len(batch)
+            self.stats["batches"] += 1
+
+    async def _respond(self, line: bytes, writer: asyncio.StreamWriter):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise TypeError(f"A request is a JSON object, not {type(request).__name__}")
+            request_id = request.get("id")
+            op = request.get("op")
+            if op == "sample":
+                response = {"action": await self.sample(request["strategy"], request["infoset"])}
+            elif op == "distribution":
+                response = {"distribution": self.strategies[request["strategy"]].distribution(request["infoset"])}
+            elif op == "strategies":
+                response = {"strategies": {name: len(table.index) for name, table in self.strategies.items()}}
+            elif op == "stats":
+                response = {"stats": dict(self.stats)}
+            else:
+                raise ValueError(f"Unknown op {op}")
+        except KeyError as e:
+            response = {"error": f"Unknown strategy or infoset {e}"}
+        except (ValueError, TypeError) as e:
+            response = {"error": str(e)}
+
+        self.stats["requests"] += 1
+        writer.write(json.dumps({"id": request_id, **response}).encode() + b"\n")
+        await writer.drain()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str):
+        batcher = self.start()
+        server = await start_listener(self.handle_connection, address)
+        path = parse_address(address)[0]
+
+        print(f"Serving {', '.join(self.strategies)} on {address}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+
+def _connect(address: str) -> socket.socket:
+    path, host, port = parse_address(address)
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        return sock
+    return socket.create_connection((host, port))
+
+
+class StrategyClient:
+    # Blocking client for scripts that play one move at a time (see play_coin_game.py --server)
+    def __init__(self, address: str):
+        self.sock = _connect(address)
+        self.file = self.sock.makefile("rwb")
+        self.next_id = 0
+
+    def request(self, **message) -> dict:
+        self.next_id += 1
+        self.file.write(json.dumps({"id": self.next_id, **message}).encode() + b"\n")
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if "error" in response:
+            raise KeyError(response["error"])
+        return response
+
+    def sample(self, strategy: str, infoset: str) -> str:
+        return self.request(op="sample", strategy=strategy, infoset=infoset)["action"]
+
+    def distribution(self, strategy: str, infoset: str) -> dict[str, float]:
+        return self.request(op="distribution", strategy=strategy, infoset=infoset)["distribution"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncStrategyClient:
+    # Pipelining client: any number of requests can be in flight on one connection
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.pending: dict[int, asyncio.Future] = {}
+        self.dispatcher = asyncio.create_task(self._dispatch())
+
+    @classmethod
+    async def connect(cls, address: str):
+        path, host, port = parse_address(address)
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _dispatch(self):
+        while line := await self.reader.readline():
+            response = json.loads(line)
+            future = self.pending.pop(response["id"], None)
+            if future is not None and not future.done():
+                future.set_result(response)
+
+    async def request(self, **message) -> dict:
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        self.writer.write(json.dumps({"id": self.next_id, **message}).encode() + b"\n")
+        response = await future
+        if "error" in response:
+            raise KeyError(response["error"])
+        return response
+
+    async def sample(self, strategy: str, infoset: str) -> str:
+        return (await self.request(op="sample", strategy=strategy, infoset=infoset))["action"]
+
+    async def close(self):
+        self.dispatcher.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def run_load(address: str, strategy: str, num_requests: int, connections: int, concurrency: int,
+                   seed: int = None) -> dict:
+    # Sample requests for random infosets of `strategy` from `connections` clients with `concurrency` requests in
+    # flight each, returns the throughput and latency percentiles
+    keys = list(strategy_format.load_strategy(strategy_path(strategy)))
+    rng = np.random.default_rng(seed)
+    infosets = [keys[i] for i in rng.integers(0, len(keys), size=num_requests)]
+
+    clients = [await AsyncStrategyClient.connect(address) for _ in range(connections)]
+    before = (await clients[0].request(op="stats"))["stats"]
+    latencies = np.zeros(num_requests)
+    next_request = 0
+
+    async def worker(client):
+        nonlocal next_request
+        while next_request < num_requests:
+            i = next_request
+            next_request += 1
+            start = time.perf_counter()
+            await client.sample(strategy, infosets[i])
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(client) for client in clients for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    after = (await clients[0].request(op="stats"))["stats"]
+    for client in clients:
+        await client.close()
+
+    batches = after["batches"] - before["batches"]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "requests": num_requests, "wall": wall, "throughput": num_requests / wall,
+        "p50": p50, "p95": p95, "p99": p99, "max": latencies.max(),
+        "mean_batch": (after["samples"] - before["samples"]) / batches if batches else 0.0,
+    }
+
+
+def load_strategies(names: list[str]) -> dict[str, DenseStrategy]:
+    strategies = {}
+    for name in names:
+        start = time.perf_counter()
+        strategies[name] = DenseStrategy(strategy_format.load_strategy(strategy_path(name)))
+        print(f"Loaded {name}: {len(strategies[name].index)} infosets in {time.perf_counter() - start:.2f}s")
+    return strategies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve strategies to game clients, or load test a running server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Load the strategies and answer requests")
+    serve_parser.add_argument(
+        "--address", type=str, default="/tmp/coin_game.sock", help="Unix socket path or host:port"
+    )
+    serve_parser.add_argument(
+        "--strategies", type=str, nargs="+", default=None,
+        help="Strategies to load, e.g. coin_game_c1p3 khun_poker (defaults to every available one)"
+    )
+    serve_parser.add_argument("--max-batch", type=int, default=1024, help="Largest batch of samples")
+    serve_parser.add_argument(
+        "--max-delay", type=float, default=0.0, help="Seconds a batch waits for more requests after the first"
+    )
+    serve_parser.add_argument("--seed", type=int, default=None, help="Random seed of the sampling")
+
+    bench_parser = subparsers.add_parser("bench", help="Measure the throughput and latency of a running server")
+    bench_parser.add_argument(
+        "--address", type=str, default="/tmp/coin_game.sock", help="Unix socket path or host:port"
+    )
+    bench_parser.add_argument("--strategy", type=str, default="coin_game_c1p3", help="Strategy to query")
+    bench_parser.add_argument("--requests", type=int, default=100_000, help="Number of sample requests")
+    bench_parser.add_argument("--connections", type=int, default=50, help="Client connections")
+    bench_parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight per connection")
+    bench_parser.add_argument("--seed", type=int, default=None, help="Random seed of the infosets queried")
+
+    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
+
+    if args["command"] == "serve":
+        server = StrategyServer(
+            load_strategies(args["strategies"] or available_strategies()),
+            max_batch=args["max_batch"], max_delay=args["max_delay"], seed=args["seed"],
+        )
+        try:
+            asyncio.run(server.serve(args["address"]))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    results = asyncio.run(run_load(
+        args["address"], args["strategy"], args["requests"], args["connections"], args["concurrency"], args["seed"]
+    ))
+    print(f"{results['requests']} requests in {results['wall']:.2f}s: {results['throughput']:,.0f} requests/s, "
+          f"mean batch {results['mean_batch']:.1f}")
+    print(f"Latency p50 {results['p50'] * 1e3:.2f}ms, p95 {results['p95'] * 1e3:.2f}ms, "
+          f"p99 {results['p99'] * 1e3:.2f}ms, max {results['max'] * 1e3:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
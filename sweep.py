@@ -0,0 +1,164 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import main
+from grid import parse_grid
+
+
+# Solves a grid of (coins, players) configurations on a process pool. Every configuration runs main.py with the
+# same solver arguments in its own process (its output goes to a .log file next to the strategy), the most expensive
+# ones are started first, and the strategy is written by main.py as soon as the configuration finishes. A .sweep.json
+# file records the solver arguments of every strategy, so configurations whose strategy is newer than the solver
+# sources and was solved with the same arguments are skipped.
+#
+#   uv run sweep.py --grid 1x2,1x3,1x4,2x3,2x4 --jobs 4 -- --variant dcfr --stop-exploitability 0.01
+
+SOLVER_SOURCES = ("main.py", "extensive_form.py", "games.py", "parallel_cfr.py", "best_response.py")
+# main.py options naming a single file, every configuration would read or overwrite the same one (each configuration
+# already gets its own files next to its strategy)
+PER_RUN_PATH_FLAGS = ("--metrics-path", "--checkpoint-path", "--profile-output", "--resume", "--init-strategy")
+
+
+def estimated_cost(number_coins: int, number_players: int) -> int:
+    # Work of one iteration: every infoset updates every action
+    return main.count_infosets(number_coins, number_players) * (number_players * number_coins + 1)
+
+
+def per_run_path_args(extra_args: list[str]) -> list[str]:
+    return [arg for arg in extra_args if arg.split("=", 1)[0] in PER_RUN_PATH_FLAGS]
+
+
+def solver_args(number_coins: int, number_players: int, extra_args: list[str]) -> list[str]:
+    return ["-nc", str(number_coins), "-p", str(number_players), "--no-plot"] + extra_args
+
+
+def is_up_to_date(number_coins: int, number_players: int, extra_args: list[str]) -> bool:
+    file_name = main.strategy_file_name(number_coins, number_players)
+    try:
+        with open(f'{file_name}.sweep.json', 'r') as f:
+            recorded = json.load(f)
+        strategy_time = os.path.getmtime(f'{file_name}.json')
+    except (OSError, ValueError):
+        return False
+
+    sources_time = max(os.path.getmtime(source) for source in SOLVER_SOURCES if os.path.exists(source))
+    return recorded.get("args") == extra_args and strategy_time >= sources_time
+
+
+def solve_config(number_coins: int, number_players: int, extra_args: list[str]) -> float:
+    # Runs in a worker process, returns the wall time
+    file_name = main.strategy_file_name(number_coins, number_players)
+    start = time.perf_counter()
+    with open(f'{file_name}.log', 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            main.main(solver_args(number_coins, number_players, extra_args))
+        except SystemExit as e:
+            # argparse errors exit, they are reported as a failed configuration
+            raise RuntimeError(f"main.py exited with status {e.code}") from None
+
+    with open(f'{file_name}.sweep.json', 'w') as f:
+        json.dump({"args": extra_args, "wall": time.perf_counter() - start}, f)
+    return time.perf_counter() - start
+
+
+def last_iteration(metrics_path: str) -> int:
+    # Iteration of the last sample in a metrics log that is still being written, None before the first flush
+    try:
+        with open(metrics_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 256))
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    for line in reversed(lines):
+        iteration = line.split(b",", 1)[0]
+        if iteration.isdigit():
+            return int(iteration)
+    return None
+
+
+def run_sweep(grid: list[tuple[int, int]], extra_args: list[str], jobs: int, force: bool = False,
+              progress_every: float = 10.0) -> dict:
+    configs = sorted(set(grid), key=lambda config: estimated_cost(*config), reverse=True)
+    if not force:
+        skipped = [config for config in configs if is_up_to_date(*config, extra_args)]
+        for number_coins, number_players in skipped:
+            print(f"Skipping c{number_coins}p{number_players}, its strategy is up to date")
+        configs = [config for config in configs if config not in skipped]
+
+    total_cost = sum(estimated_cost(*config) for config in configs)
+    done_cost = 0
+    results = {}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = {executor.submit(solve_config, *config, extra_args): config for config in configs}
+        while pending:
+            finished, _ = wait(pending, timeout=progress_every, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                number_coins, number_players = config = pending.pop(future)
+                name = f"c{number_coins}p{number_players}"
+                log_path = f'{main.strategy_file_name(*config)}.log'
+                try:
+                    wall = future.result()
+                    results[name] = {"status": "done", "wall": wall}
+                    print(f"Solved {name} in {wall:.1f}s")
+                except Exception as e:
+                    results[name] = {"status": "failed", "error": str(e)}
+                    print(f"Failed {name}: {e} (see {log_path})")
+                done_cost += estimated_cost(*config)
+
+            # Aggregated progress: finished configurations, share of the estimated work and the running iterations
+            elapsed = time.perf_counter() - start
+            share = done_cost / total_cost if total_cost else 1.0
+            eta = f", ETA {elapsed / share - elapsed:.0f}s" if 0 < share < 1 else ""
+            running = [
+                f"c{c}p{p}@{last_iteration(f'{main.strategy_file_name(c, p)}.metrics.csv') or 0}"
+                for future, (c, p) in pending.items() if future.running()
+            ]
+            print(f"[{len(results)}/{len(configs)}] {share:.0%} of the work in {elapsed:.0f}s{eta}"
+                  + (f" | running {' '.join(running)}" if running else ""), flush=True)
+
+    return results
+
+
+def main_sweep():
+    parser = argparse.ArgumentParser(
+        description="Solve a grid of coin game configurations in parallel. Arguments after -- are passed to main.py"
+    )
+    parser.add_argument(
+        "--grid", type=str, required=True, help="Comma separated CxP configurations, e.g. 1x3,2x3"
+    )
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Configurations solved at the same time")
+    parser.add_argument("--force", action="store_true", help="Solve configurations whose strategy is up to date")
+    parser.add_argument("--progress-every", type=float, default=10.0, help="Seconds between progress reports")
+    parser.add_argument("solver_args", nargs=argparse.REMAINDER, help="main.py arguments, after --")
+
+    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
+
+    extra_args = args["solver_args"]
+    if extra_args and extra_args[0] == "--":
+        extra_args = extra_args[1:]
+    shared_paths = per_run_path_args(extra_args)
+    if shared_paths:
+        parser.error(f"{', '.join(shared_paths)} would be shared by every configuration, "
+                     f"the sweep writes the files of each one next to its strategy")
+
+    results = run_sweep(parse_grid(args["grid"]), extra_args, args["jobs"], force=args["force"],
+                        progress_every=args["progress_every"])
+    failed = [name for name, result in results.items() if result["status"] == "failed"]
+    if failed:
+        print(f"{len(failed)} configurations failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_sweep()
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+from games import CoinGame, KuhnPoker
+from strategy_server import (
+    KHUN_POKER, AsyncStrategyClient, StrategyServer, load_strategies, parse_address, start_listener,
+)
+
+
+# Multi-table game runner. Any number of coin game or Kuhn poker tables are played concurrently in one event loop,
+# driven by the Game definitions of games.py. A table is a list of seats sharing one interface, so a table can mix:
+#   - BotSeat, which samples its strategy through an in-process StrategyServer (its batcher pools the decisions of
+#     every table into one vectorized draw) or a running strategy_server.py daemon
+#   - HumanSeat, a player connected over a local socket (e.g. `nc -U /tmp/coin_tables.sock`), one line per answer
+# Seats rotate after every game, as the human seat of play_coin_game.py does.
+#
+#   uv run table_runner.py --game coin -nc 1 -p 3 --tables 500 --games 100
+#   uv run table_runner.py --game khun --tables 0 --human-address /tmp/khun_tables.sock
+
+def strategy_name(game_name: str, number_coins: int, number_players: int) -> str:
+    if game_name == "coin":
+        return f"coin_game_c{number_coins}p{number_players}"
+    return KHUN_POKER
+
+
+class BotSeat:
+    def __init__(self, sampler, rng: random.Random):
+        # sampler: StrategyServer or AsyncStrategyClient, both have `async sample(strategy, infoset)`
+        self.sampler = sampler
+        self.rng = rng
+        self.score = 0.0
+
+    async def choose(self, prompt: str, options: list[str], infoset: tuple = None) -> str:
+        # A decision of the game is sampled from the strategy, anything else (the coins of the coin game) is uniform
+        if infoset is None:
+            return self.rng.choice(options)
+        return await self.sampler.sample(*infoset)
+
+    async def tell(self, message: str):
+        pass
+
+
+class HumanSeat:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.score = 0.0
+
+    async def choose(self, prompt: str, options: list[str], infoset: tuple = None) -> str:
+        while True:
+            self.writer.write(prompt.encode())
+            await self.writer.drain()
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionResetError("Human player left the table")
+            answer = line.decode().strip().lower()
+            if answer in options:
+                return answer
+            await self.tell(f"Input a valid choice ({', '.join(options)})!")
+
+    async def tell(self, message: str):
+        self.writer.write(f"{message}\n".encode())
+        await self.writer.drain()
+
+
+async def broadcast(seats: list, message: str):
+    for seat in seats:
+        await seat.tell(message)
+
+
+class TableRunner:
+    def __init__(self, game_name: str, number_coins: int = 1, number_players: int = 3, sampler=None,
+                 seed: int = None):
+        if game_name == "coin":
+            self.game = CoinGame(number_coins, number_players)
+            self.deals = None
+        else:
+            self.game = KuhnPoker()
+            self.deals = self.game.chance_outcomes()
+        self.strategy = strategy_name(game_name, number_coins, number_players)
+        self.sampler = sampler
+        self.rng = random.Random(seed)
+        self.games = 0
+        # Summed payoffs by position in the play order
+        self.position_payoffs = [0.0] * self.game.num_players
+
+    def bot_seats(self, count: int) -> list:
+        return [BotSeat(self.sampler, self.rng) for _ in range(count)]
+
+    async def deal(self, seats: list) -> tuple:
+        if self.deals is None:
+            # Coin game seats pick their own coins, bots uniformly like the chance outcomes of the solver
+            options = [str(i) for i in range(self.game.number_coins + 1)]
+            prompt = f"Choose number of coins (0 - {self.game.number_coins}): "
+            return tuple([int(await seat.choose(prompt, options)) for seat in seats])
+        deals, probs = zip(*self.deals)
+        deal = self.rng.choices(deals, weights=probs)[0]
+        for player, seat in enumerate(seats):
+            await seat.tell(f"Your card: {deal[player]}")
+        return deal
+
+    async def play_game(self, seats: list) -> tuple:
+        # One game with the seats in play order, returns the utility of every seat
+        game = self.game
+        deal = await self.deal(seats)
+        history = ()
+        while not game.is_terminal(history):
+            player = game.current_player(history)
+            legal = game.legal_actions(history)
+            labels = [str(game.actions[action]) for action in legal]
+            key = game.infoset_key(deal, history)
+            prompt = f"The historic is: {key}\nYour move ({', '.join(labels)}): "
+            label = await seats[player].choose(prompt, labels, (self.strategy, key))
+            history += (legal[labels.index(label)],)
+            await broadcast(seats, f"Seat {player} plays {label}")
+
+        utilities = game.terminal_utility(deal, history)
+        await broadcast(seats, f"Deal: {deal} - utilities: {tuple(float(u) for u in utilities)}")
+        return utilities
+
+    async def run_table(self, seats: list, num_games: int):
+        for i in range(num_games):
+            shift = i % len(seats)
+            order = seats[shift:] + seats[:shift]
+            for player, seat in enumerate(order):
+                await seat.tell(f"Game {i + 1}, you are seat {player}")
+
+            utilities = await self.play_game(order)
+            for player, (seat, utility) in enumerate(zip(order, utilities)):
+                seat.score += utility
+                self.position_payoffs[player] += utility
+                await seat.tell(f"Your score: {seat.score:g}")
+            self.games += 1
+
+    def human_handler(self, num_games: int):
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            # Every connection gets its own table, the other seats are bots
+            seats = [HumanSeat(reader, writer)] + self.bot_seats(self.game.num_players - 1)
+            try:
+                await self.run_table(seats, num_games)
+            except ConnectionError:
+                # The player left, the games it finished are counted
+                pass
+            finally:
+                writer.close()
+        return handle
+
+
+async def sampler_stats(sampler) -> dict:
+    if isinstance(sampler, AsyncStrategyClient):
+        return (await sampler.request(op="stats"))["stats"]
+    return dict(sampler.stats)
+
+
+async def run(args: dict):
+    strategy = strategy_name(args["game"], args["number_coins"], args["number_players"])
+    batcher = None
+    if args["server"] is not None:
+        sampler = await AsyncStrategyClient.connect(args["server"])
+    else:
+        sampler = StrategyServer(load_strategies([strategy]), max_batch=args["max_batch"], seed=args["seed"])
+        batcher = sampler.start()
+
+    runner = TableRunner(args["game"], args["number_coins"], args["number_players"], sampler, seed=args["seed"])
+
+    human_server = None
+    if args["human_address"] is not None:
+        human_server = await start_listener(runner.human_handler(args["human_games"]), args["human_address"])
+        print(f"Seating human players on {args['human_address']}", flush=True)
+
+    try:
+        if args["tables"]:
+            before = await sampler_stats(sampler)
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                runner.run_table(runner.bot_seats(runner.game.num_players), args["games"])
+                for _ in range(args["tables"])
+            ))
+            wall = time.perf_counter() - start
+            after = await sampler_stats(sampler)
+
+            samples = after["samples"] - before["samples"]
+            batches = after["batches"] - before["batches"]
+            print(f"{runner.games} games on {args['tables']} tables in {wall:.2f}s: {runner.games / wall:,.0f} games/s, "
+                  f"{samples / wall:,.0f} decisions/s, mean batch {samples / batches if batches else 0.0:.1f}")
+            mean_payoffs = [payoff / runner.games for payoff in runner.position_payoffs]
+            print(f"Mean utility by seat: {' '.join(f'{payoff:.4f}' for payoff in mean_payoffs)}")
+
+        if human_server is not None:
+            async with human_server:
+                await human_server.serve_forever()
+    finally:
+        if batcher is not None:
+            batcher.cancel()
+        if isinstance(sampler, AsyncStrategyClient):
+            await sampler.close()
+        path = parse_address(args["human_address"])[0] if args["human_address"] is not None else None
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many coin game or Kuhn poker tables concurrently")
+    parser.add_argument("--game", type=str, choices=["coin", "khun"], default="coin", help="Game played")
+    parser.add_argument(
+        "-nc", "--number_coins", type=int, default=1, help="Number of coins"
+    )
+    parser.add_argument(
+        "-p", "--number_players", type=int, default=3, help="Number of players"
+    )
+    parser.add_argument("--tables", type=int, default=100, help="Bot-only tables played concurrently")
+    parser.add_argument("--games", type=int, default=100, help="Games per bot table")
+    parser.add_argument(
+        "--human-address", type=str, default=None,
+        help="Unix socket path or host:port where human players connect, each gets a table with bots"
+    )
+    parser.add_argument("--human-games", type=int, default=10, help="Games per human table")
+    parser.add_argument(
+        "--server", type=str, default=None,
+        help="Sample from a running strategy_server.py instead of loading the strategy in this process"
+    )
+    parser.add_argument("--max-batch", type=int, default=1024, help="Largest batch of samples of the in-process server")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed of the deals and the sampling")
+
+    arglist = [x for x in sys.argv[1:] if not x.startswith("__")]
+    args = vars(parser.parse_args(args=arglist))
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()